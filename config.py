@@ -54,9 +54,12 @@ DATABASE_PATH = os.path.join(BASE_DIR, "hosting_bot.db")
 BOTS_DIR = os.path.join(BASE_DIR, "hosted_bots")
 LOGS_DIR = os.path.join(BASE_DIR, "bot_logs")
 GIT_REPOS_DIR = os.path.join(BASE_DIR, "git_repos")
+VENVS_DIR = os.path.join(BASE_DIR, "venvs")  # Shared per-requirements virtualenvs
+WHEEL_CACHE_DIR = os.path.join(BASE_DIR, "wheel_cache")  # Local wheels for offline rebuilds
+LOG_INDEX_PATH = os.path.join(BASE_DIR, "log_index.db")  # Full-text index of bot logs (/logsearch)
 
 # Create directories
-for directory in [BOTS_DIR, LOGS_DIR, GIT_REPOS_DIR]:
+for directory in [BOTS_DIR, LOGS_DIR, GIT_REPOS_DIR, VENVS_DIR, WHEEL_CACHE_DIR]:
     os.makedirs(directory, exist_ok=True)
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -104,8 +107,121 @@ EMOJI = {
 MAINTENANCE_MODE = False  # Toggle with /maintenance command
 PREMIUM_CHECK_INTERVAL = 3600  # Check premium expiry every hour
 MAX_LOG_LINES = 100  # Max log lines to display
+LOG_TAIL_BLOCK = 64 * 1024  # Bytes per backwards read when tailing a log
+OUTPUT_RING_LINES = 500  # Recent output lines kept in memory per bot
+OUTPUT_POLL_INTERVAL = 0.25  # Seconds between reads of running bots' new log output
+OUTPUT_READ_BYTES = 4 * 1024 * 1024  # Most new output read per bot per poll
+OUTPUT_MAX_LINE = 64 * 1024  # Longer unterminated lines are clipped in memory
+OUTPUT_MAX_TRACEBACK_LINES = 100  # Lines kept per captured traceback (the last ones)
+OUTPUT_TRACEBACK_GIVE_UP_LINES = 5000  # Capture is dropped if no exception line follows within this
+ERROR_FINGERPRINT_FRAMES = 3  # Innermost traceback frames that identify a crash
+ERROR_FLUSH_INTERVAL = 5  # Seconds crash counts are aggregated before the DB write
+ERROR_ALERT_INTERVAL = 300  # Min seconds between crash alerts for one bot
+LOG_PAGE_BYTES = 3000  # Bytes per page in the paged log viewer
+LOG_PAGE_MAX_CHARS = 3800  # Page text cap after HTML escaping (Telegram allows 4096)
+LOG_DOWNLOAD_MB = 5  # "Download" sends this much of the newest log, gzipped
+LOG_INDEX_BLOCK_LINES = 20  # Log lines per full-text index row
+LOG_SEARCH_CONTEXT = 2  # Lines shown around each /logsearch hit
+LOG_SEARCH_MAX_RESULTS = 10  # Matching blocks per /logsearch reply
+LOG_FOLLOW_LINES = 40  # Lines shown in a live log view
+LOG_FOLLOW_MAX_CHARS = 3500  # Live view text cap (Telegram allows 4096)
+LOG_FOLLOW_POLL_INTERVAL = 1.0  # Seconds between reads of newly appended bytes
+LOG_FOLLOW_EDIT_INTERVAL = 3.0  # Min seconds between edits of one live message
+LOG_FOLLOW_MAX_READ = 256 * 1024  # Larger bursts are skipped to their tail
+LOG_FOLLOW_IDLE = 300  # A live view stops after this long without new output
+LOG_FOLLOW_MAX_DURATION = 1800  # Hard cap for one live view (seconds)
 SHELL_TIMEOUT = 30  # Timeout for /exec commands (seconds)
 GIT_CLONE_TIMEOUT = 300  # Git clone timeout (5 minutes)
+METRICS_INTERVAL = 15  # Seconds between per-bot CPU/RAM samples
+METRICS_HISTORY = 240  # Samples kept per bot (240 x 15s = 1 hour)
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Active bot log size that triggers rotation
+LOG_KEEP_SEGMENTS = 5  # Gzipped segments kept per bot
+LOG_RETENTION_DAYS = 14  # Segments older than this are deleted
+LOG_COMPRESS_LEVEL = 6  # gzip level for rotated segments
+LOG_ROTATE_INTERVAL = 30  # Seconds between log size checks
+VENV_BUILD_TIMEOUT = 600  # Max seconds per venv/pip step for git bot requirements
+VENV_DISK_BUDGET_MB = 5120  # Venvs + wheel cache; idle venvs (LRU), then wheels are pruned above this
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🗄️ DATABASE TUNING
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+DB_BUSY_TIMEOUT = 10.0  # Seconds a writer waits for the lock before failing
+DB_SYNCHRONOUS = "NORMAL"  # WAL + NORMAL: durable on app crash, fsync only at checkpoint
+DB_CACHE_SIZE_KB = 16384  # Page cache per connection (16 MB)
+DB_CACHED_STATEMENTS = 256  # Prepared statements kept per connection
+ACTIVITY_FLUSH_INTERVAL = 30  # Seconds between last_activity write-behind flushes
+ACTIVITY_FLUSH_THRESHOLD = 500  # Flush early once this many users are buffered
+USER_CACHE_SIZE = 10000  # Max user profiles kept in memory (LRU)
+USER_CACHE_TTL = 300  # Seconds a cached profile stays valid
+STATS_RECONCILE_INTERVAL = 21600  # Recount stats counters every 6 hours
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# ♻️ PROCESS SUPERVISOR
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+DEFAULT_RESTART_POLICY = "on-failure"  # always / on-failure / never
+STOP_TIMEOUT = 5  # Seconds after SIGTERM before SIGKILL
+READY_GRACE = 3  # A restarted bot alive this long (seconds) counts as ready
+READY_MARKERS = ["Start polling", "BOT_READY"]  # Log lines that signal readiness early
+READY_POLL_INTERVAL = 0.1  # Seconds between readiness checks
+RESTART_BACKOFF_BASE = 2  # First auto-restart delay (seconds), doubles per crash
+RESTART_BACKOFF_MAX = 300  # Backoff ceiling (seconds)
+RESTART_RESET_AFTER = 600  # A run this long (seconds) resets the backoff
+CRASH_LOOP_WINDOW = 300  # Crash-loop detection window (seconds)
+CRASH_LOOP_THRESHOLD = 5  # Exits within the window that pause auto-restart
+ADOPT_POLL_INTERVAL = 5  # Seconds between liveness checks of re-adopted bots
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🍴 LAUNCH MODE
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# "exec"       -> fresh interpreter per bot (safest, slowest cold start)
+# "forkserver" -> fork bots from a pre-warmed interpreter (forkserver.py)
+#                 that already imported FORKSERVER_PRELOAD; the modules are
+#                 shared copy-on-write. Falls back to exec if it fails
+# "worker"     -> bots of WORKER_TIERS that pass worker.inspect_bot() run as
+#                 asyncio tasks inside a pool of shared interpreters
+#                 (worker.py); all others use exec
+LAUNCH_MODE = "exec"
+FORKSERVER_PRELOAD: List[str] = ["asyncio", "aiohttp", "aiogram", "telebot", "requests"]
+FORKSERVER_START_TIMEOUT = 30  # Seconds allowed for preloading / a fork reply
+FORKSERVER_START_TOLERANCE = 10  # Seconds between a forked bot's creation and its recorded last_start
+WORKER_POOL_SIZE = 4  # Shared worker interpreters at most
+WORKER_MAX_BOTS = 50  # Bots per worker; a full pool falls back to exec
+WORKER_TIERS: List[str] = ["free"]  # Tiers that may share a worker (others keep their own process)
+WORKER_PRELOAD: List[str] = ["aiohttp", "aiogram"]
+WORKER_KILL_GRACE = 3  # Seconds a killed shared bot gets to go before its worker is recycled
+WORKER_STALL_TIMEOUT = 10  # Seconds without a worker heartbeat before it is recycled
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🚦 START SCHEDULER (admission control)
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+MAX_CONCURRENT_STARTS = 8  # Interpreters allowed to boot at the same time
+START_SETTLE_TIME = 1.0  # Seconds a start holds its slot unless it reports ready sooner
+ADMISSION_MAX_LOAD = 1.5  # 1-min load average per core above which starts wait
+ADMISSION_MIN_FREE_MB = 256  # Available RAM below which starts wait
+ADMISSION_RETRY_INTERVAL = 2  # Seconds between headroom checks while paused
+PREMIUM_LANE_WEIGHT = 4  # Premium starts served per free start when both are waiting
+START_QUEUE_TIMEOUT = 600  # A start waiting longer than this fails
+QUEUE_UPDATE_INTERVAL = 3  # Seconds between queue-position message updates
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🧱 RESOURCE LIMITS (per tier, None = unlimited)
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# memory_mb    -> RLIMIT_AS (+ cgroup memory.max)
+# cpu_seconds  -> RLIMIT_CPU, total CPU time per run (SIGXCPU when exceeded)
+# open_files   -> RLIMIT_NOFILE
+# processes    -> RLIMIT_NPROC (+ cgroup pids.max). NOTE: the kernel counts every
+#                 process/thread of the Unix user, so keep it high unless bots run
+#                 under a dedicated account
+# cpu_percent  -> cgroup cpu.max only (100 = one full core)
+RESOURCE_LIMITS: Dict[str, Dict] = {
+    "free": {"memory_mb": 256, "cpu_seconds": 3600, "open_files": 256, "processes": 4096, "cpu_percent": 25},
+    "premium": {"memory_mb": 1024, "cpu_seconds": None, "open_files": 1024, "processes": 4096, "cpu_percent": 100},
+    # A whole shared worker (LAUNCH_MODE "worker"); its bots have no limits of their own
+    "worker": {"memory_mb": 2048, "cpu_seconds": None, "open_files": 8192, "processes": 4096, "cpu_percent": 100},
+}
+# cgroup v2 parent for per-bot groups (must exist, be writable and have the
+# memory/pids/cpu controllers enabled in cgroup.subtree_control). None = off
+CGROUP_ROOT = None  # e.g. "/sys/fs/cgroup/gadget_host"
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 🔒 SECURITY SETTINGS
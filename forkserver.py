@@ -0,0 +1,208 @@
+# ═══════════════════════════════════════════════════════════
+#  GADGET PREMIUM HOST - Forkserver
+#  Pre-warmed interpreter that forks one child per hosted bot
+#  Usage: python forkserver.py <socket_path> [module ...]
+# ═══════════════════════════════════════════════════════════
+#
+# Started by the controller when config.LAUNCH_MODE == "forkserver".
+# It imports the listed modules once, then serves spawn requests on a
+# Unix socket. Forked bots share those modules copy-on-write instead of
+# importing them again, so they start faster and use less memory.
+#
+# Protocol (one connection per bot):
+#   controller -> server   JSON {"file_path", "cwd", "limits"} + the output fd (SCM_RIGHTS)
+#                          limits: {"rlimits": [[name, soft, hard], ...], "cgroup": path} or null,
+#                          applied by the child before the bot's code runs
+#   server -> controller   {"pid": N}\n             right after fork
+#   server -> controller   {"exit": code}\n         when the bot exits
+#                          (negative code = killed by that signal)
+#
+# The server must stay single-threaded (fork + threads don't mix) and
+# exits when the controller closes its stdin. Bots still running then
+# are reparented to init and keep writing to their log file, so the next
+# controller's reconcile re-adopts them.
+
+import atexit
+import importlib
+import json
+import os
+import random
+import resource
+import runpy
+import selectors
+import signal
+import socket
+import sys
+import threading
+import traceback
+from typing import Dict, List, Optional
+
+
+def preload(modules: List[str]):
+    """Import the common bot libraries once (missing ones are skipped)"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"forkserver: preload {name} failed: {e}", file=sys.stderr, flush=True)
+
+
+def apply_limits(limits: Optional[Dict]):
+    """Join the bot's cgroup and set its rlimits (failures go to the bot's log)"""
+    if not limits:
+        return
+    if limits["cgroup"]:
+        try:
+            with open(limits["cgroup"], "w") as f:
+                f.write(str(os.getpid()))
+        except OSError as e:
+            print(f"limits: cgroup placement failed: {e}", file=sys.stderr)
+    for name, soft, hard in limits["rlimits"]:
+        try:
+            resource.setrlimit(getattr(resource, name), (soft, hard))
+        except (OSError, ValueError) as e:
+            print(f"limits: {name} not applied: {e}", file=sys.stderr)
+
+
+def run_bot(request: Dict, output_fd: int):
+    """Child side of the fork: become the bot and never return"""
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(output_fd, 1)
+    os.dup2(output_fd, 2)
+    os.close(devnull)
+    os.close(output_fd)
+    # Fresh stdio objects: nothing buffered in the server leaks into the bot log
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", buffering=1, errors="backslashreplace", closefd=False)
+
+    apply_limits(request.get("limits"))
+
+    file_path = request["file_path"]
+    os.chdir(request["cwd"])
+    sys.argv = [file_path]
+    sys.path[0] = os.path.dirname(file_path)
+    # Every child would otherwise inherit the same PRNG state
+    random.seed()
+
+    code = 0
+    try:
+        runpy.run_path(file_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException as e:
+        # Hide the runpy/forkserver frames, like a plain `python bot.py` would
+        tb = e.__traceback__
+        while tb and tb.tb_frame.f_code.co_filename != file_path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        code = 1
+    finally:
+        # What a normal interpreter exit does: join threads, run atexit
+        try:
+            threading._shutdown()
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code & 0xFF)
+
+
+def serve(socket_path: str):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(64)
+
+    # SIGCHLD wakes the select loop through this pipe
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ, "accept")
+    selector.register(wake_r, selectors.EVENT_READ, "reap")
+    selector.register(sys.stdin.fileno(), selectors.EVENT_READ, "controller")
+
+    watchers: Dict[int, socket.socket] = {}
+
+    def spawn(conn: socket.socket):
+        conn.settimeout(5)
+        try:
+            msg, fds, _, _ = socket.recv_fds(conn, 65536, 1)
+            request = json.loads(msg)
+            if len(fds) != 1:
+                raise ValueError("expected exactly one output fd")
+        except (OSError, ValueError) as e:
+            print(f"forkserver: bad request: {e}", file=sys.stderr, flush=True)
+            conn.close()
+            return
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            selector.close()
+            server.close()
+            os.close(wake_r)
+            os.close(wake_w)
+            for other in watchers.values():
+                other.close()
+            conn.close()
+            run_bot(request, fds[0])
+
+        os.close(fds[0])
+        try:
+            conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+            watchers[pid] = conn
+        except OSError:
+            conn.close()
+
+    def reap():
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = watchers.pop(pid, None)
+            if conn is None:
+                continue
+            try:
+                conn.sendall(json.dumps({"exit": os.waitstatus_to_exitcode(status)}).encode() + b"\n")
+            except OSError:
+                pass
+            conn.close()
+
+    sys.stdout.write("READY\n")
+    sys.stdout.flush()
+
+    while True:
+        for key, _ in selector.select():
+            if key.data == "accept":
+                conn, _ = server.accept()
+                spawn(conn)
+            elif key.data == "reap":
+                os.read(wake_r, 4096)
+                reap()
+            elif not os.read(sys.stdin.fileno(), 1024):
+                return  # Controller went away
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: forkserver.py <socket_path> [module ...]")
+    preload(sys.argv[2:])
+    serve(sys.argv[1])
@@ -6,6 +6,12 @@
 # ═══════════════════════════════════════════════════════════
 
 import asyncio
+import functools
+import glob
+import gzip
+import hashlib
+import html
+import json
 import sqlite3
 import ast
 import os
@@ -13,11 +19,18 @@ import sys
 import psutil
 import subprocess
 import shutil
+import signal
+import socket
 import logging
 import time
 import re
+import tempfile
+import threading
 import traceback
-from datetime import datetime, timedelta
+import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List, Tuple
 from pathlib import Path
 
@@ -28,9 +41,9 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, 
-    InlineKeyboardButton, FSInputFile
+    InlineKeyboardButton, BufferedInputFile
 )
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 
 try:
     import git
@@ -38,6 +51,7 @@ except ImportError:
     git = None
 
 import config
+from worker import inspect_bot
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 📋 LOGGING SETUP
@@ -52,16 +66,188 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# ⚡ IN-MEMORY CACHE
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None (counts a hit or a miss)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total * 100) if total else 0.0
+        }
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🗂️ BOT REGISTRY - In-Memory Index of hosted_bots
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class BotRecord:
+    """One hosted_bots row. Supports bot['field'] like the old dicts."""
+    __slots__ = (
+        "id", "user_id", "bot_name", "file_path", "process_id", "status",
+        "created_at", "last_start", "total_starts", "source_type", "git_url",
+        "last_exit_code", "restart_policy"
+    )
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class BotRegistry:
+    """
+    hosted_bots mirrored in memory, indexed by bot id and by owner.
+    Database write paths keep it in sync; reads never touch SQLite.
+    """
+
+    def __init__(self):
+        self.by_id: Dict[int, BotRecord] = {}
+        self.by_owner: Dict[int, Dict[int, BotRecord]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, rows: List[tuple]):
+        with self._lock:
+            self.by_id.clear()
+            self.by_owner.clear()
+            for row in rows:
+                self._add(BotRecord(*row))
+
+    def _add(self, record: BotRecord):
+        self.by_id[record.id] = record
+        self.by_owner.setdefault(record.user_id, {})[record.id] = record
+
+    def add(self, record: BotRecord):
+        with self._lock:
+            self._add(record)
+
+    def remove(self, bot_id: int):
+        with self._lock:
+            record = self.by_id.pop(bot_id, None)
+            if record:
+                owned = self.by_owner.get(record.user_id, {})
+                owned.pop(bot_id, None)
+                if not owned:
+                    self.by_owner.pop(record.user_id, None)
+
+    def get(self, bot_id: int) -> Optional[BotRecord]:
+        return self.by_id.get(bot_id)
+
+    def get_owned(self, user_id: int, bot_id: int) -> Optional[BotRecord]:
+        """The bot if user_id owns it, else None"""
+        return self.by_owner.get(user_id, {}).get(bot_id)
+
+    def all(self) -> List[BotRecord]:
+        with self._lock:
+            return list(self.by_id.values())
+
+    def for_user(self, user_id: int) -> List[BotRecord]:
+        """A user's bots, newest first"""
+        with self._lock:
+            records = list(self.by_owner.get(user_id, {}).values())
+        records.sort(key=lambda r: (r.created_at or "", r.id), reverse=True)
+        return records
+
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 🗄️ ENHANCED DATABASE MANAGER
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 class Database:
     def __init__(self, db_path: str):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # Write-behind buffer: user_id -> last activity (UTC, CURRENT_TIMESTAMP format)
+        self._activity_buffer: Dict[int, str] = {}
+        self._activity_lock = threading.Lock()
+        # User profile cache (write paths below invalidate it)
+        self.user_cache = TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+        # hosted_bots index (loaded in init_database, maintained by bot write paths)
+        self.bots = BotRegistry()
         self.init_database()
     
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    @staticmethod
+    def now() -> str:
+        """UTC timestamp in SQLite CURRENT_TIMESTAMP format"""
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Return the calling thread's long-lived connection.
+        Opened once per thread with WAL + tuned pragmas, then reused so a
+        query is a plain (cached) statement execution, not a file open.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=config.DB_BUSY_TIMEOUT,
+                cached_statements=config.DB_CACHED_STATEMENTS,
+                check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+            conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def close(self):
+        """Close every pooled connection (called on shutdown)"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
     
     def init_database(self):
         """Initialize database with all tables"""
@@ -128,9 +314,154 @@ class Database:
         """)
         
         conn.commit()
-        conn.close()
+        self.migrate()
+        
+        slow = self.check_query_plans()
+        for name, plan in slow.items():
+            logger.warning(f"⚠️ Hot query '{name}' scans a table: {plan}")
+        
+        cursor.execute(f"SELECT {', '.join(BotRecord.__slots__)} FROM hosted_bots")
+        self.bots.load(cursor.fetchall())
         logger.info("✅ Database initialized successfully")
     
+    # Versioned schema migrations: (version, description, statements).
+    # Applied in order on top of the base tables, tracked in PRAGMA user_version.
+    # Append new entries only - never edit a migration that has shipped.
+    MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+        (1, "indexes for hot access paths", [
+            "CREATE INDEX IF NOT EXISTS idx_bots_user_created ON hosted_bots (user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_bots_status ON hosted_bots (status)",
+            "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals (referrer_id)",
+            "CREATE INDEX IF NOT EXISTS idx_users_banned ON users (is_banned)",
+            "CREATE INDEX IF NOT EXISTS idx_users_premium ON users (is_premium, premium_until, first_name)",
+        ]),
+        (2, "trigger-maintained stats counters", [
+            """CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )""",
+            # users
+            """CREATE TRIGGER IF NOT EXISTS trg_users_insert AFTER INSERT ON users BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+                UPDATE stats_counters SET value = value + (NEW.is_premium = 1) WHERE name = 'premium_users';
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_users_delete AFTER DELETE ON users BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+                UPDATE stats_counters SET value = value - (OLD.is_premium = 1) WHERE name = 'premium_users';
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_users_premium AFTER UPDATE OF is_premium ON users
+            WHEN (OLD.is_premium = 1) != (NEW.is_premium = 1) BEGIN
+                UPDATE stats_counters SET value = value + (NEW.is_premium = 1) - (OLD.is_premium = 1)
+                WHERE name = 'premium_users';
+            END""",
+            # hosted_bots
+            """CREATE TRIGGER IF NOT EXISTS trg_bots_insert AFTER INSERT ON hosted_bots BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_bots';
+                UPDATE stats_counters SET value = value + (NEW.status = 'running') WHERE name = 'active_bots';
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_bots_delete AFTER DELETE ON hosted_bots BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_bots';
+                UPDATE stats_counters SET value = value - (OLD.status = 'running') WHERE name = 'active_bots';
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_bots_status AFTER UPDATE OF status ON hosted_bots
+            WHEN (OLD.status = 'running') != (NEW.status = 'running') BEGIN
+                UPDATE stats_counters SET value = value + (NEW.status = 'running') - (OLD.status = 'running')
+                WHERE name = 'active_bots';
+            END""",
+            # referrals
+            """CREATE TRIGGER IF NOT EXISTS trg_referrals_insert AFTER INSERT ON referrals BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'total_referrals';
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS trg_referrals_delete AFTER DELETE ON referrals BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'total_referrals';
+            END""",
+            # Seed from the live tables (same transaction, so no drift window)
+            "INSERT OR REPLACE INTO stats_counters VALUES ('total_users', (SELECT COUNT(*) FROM users))",
+            "INSERT OR REPLACE INTO stats_counters VALUES ('premium_users', (SELECT COUNT(*) FROM users WHERE is_premium = 1))",
+            "INSERT OR REPLACE INTO stats_counters VALUES ('active_bots', (SELECT COUNT(*) FROM hosted_bots WHERE status = 'running'))",
+            "INSERT OR REPLACE INTO stats_counters VALUES ('total_bots', (SELECT COUNT(*) FROM hosted_bots))",
+            "INSERT OR REPLACE INTO stats_counters VALUES ('total_referrals', (SELECT COUNT(*) FROM referrals))",
+        ]),
+        (3, "process supervision columns", [
+            "ALTER TABLE hosted_bots ADD COLUMN last_exit_code INTEGER",
+            "ALTER TABLE hosted_bots ADD COLUMN restart_policy TEXT",  # NULL = config.DEFAULT_RESTART_POLICY
+        ]),
+        (4, "crash fingerprint aggregation", [
+            """CREATE TABLE IF NOT EXISTS bot_errors (
+                bot_id INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                exc_type TEXT NOT NULL,
+                message TEXT,
+                frames TEXT,
+                sample TEXT,
+                count INTEGER NOT NULL DEFAULT 0,
+                first_seen TIMESTAMP NOT NULL,
+                last_seen TIMESTAMP NOT NULL,
+                PRIMARY KEY (bot_id, fingerprint)
+            )""",
+        ]),
+    ]
+    
+    # Queries that run per update / per tick and must never scan a table
+    HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+        "get_user": ("SELECT * FROM users WHERE user_id = ?", (0,)),
+        "owner_bot_count": ("SELECT COUNT(*) FROM hosted_bots WHERE user_id = ?", (0,)),
+        "referral_count": ("SELECT COUNT(*) FROM referrals WHERE referrer_id = ?", (0,)),
+        "broadcast_targets": ("SELECT user_id FROM users WHERE is_banned = 0", ()),
+        "running_bots": ("SELECT COUNT(*) FROM hosted_bots WHERE status = 'running'", ()),
+        "bot_errors": ("SELECT * FROM bot_errors WHERE bot_id = ? ORDER BY count DESC", (0,)),
+        "expired_premiums": ("""
+            SELECT user_id, first_name FROM users
+            WHERE is_premium = 1 AND premium_until < datetime('now')
+        """, ()),
+    }
+    
+    def get_schema_version(self) -> int:
+        """Current schema version (PRAGMA user_version)"""
+        return self.get_connection().execute("PRAGMA user_version").fetchone()[0]
+    
+    def migrate(self):
+        """Apply pending migrations, one transaction per version"""
+        conn = self.get_connection()
+        current = self.get_schema_version()
+        
+        for version, description, statements in self.MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                logger.error(f"❌ Migration {version} ({description}) failed")
+                raise
+            logger.info(f"🧬 Schema migrated to v{version}: {description}")
+    
+    def check_query_plans(self) -> Dict[str, str]:
+        """
+        EXPLAIN QUERY PLAN every hot query.
+        Returns {name: plan} for queries that still do a full table scan.
+        """
+        # Throwaway connection: EXPLAIN output would otherwise be served from
+        # the pooled statement cache and miss schema changes
+        conn = sqlite3.connect(self.db_path, timeout=config.DB_BUSY_TIMEOUT)
+        offenders = {}
+        try:
+            for name, (sql, params) in self.HOT_QUERIES.items():
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+                scans = [
+                    step for step in plan
+                    if step.startswith("SCAN") and "USING" not in step
+                ]
+                if scans:
+                    offenders[name] = "; ".join(plan)
+        finally:
+            conn.close()
+        return offenders
+    
     def add_user(self, user_id: int, username: str, first_name: str, referrer_id: Optional[int] = None):
         """Add new user with referral system"""
         conn = self.get_connection()
@@ -153,22 +484,26 @@ class Database:
                     WHERE user_id = ?
                 """, (config.REFERRAL_BONUS_SLOTS, referrer_id))
                 conn.commit()
+                self.user_cache.invalidate(referrer_id)
                 logger.info(f"💰 User {referrer_id} earned +{config.REFERRAL_BONUS_SLOTS} slot(s)")
         except sqlite3.IntegrityError:
-            pass  # User exists
+            conn.rollback()  # User exists - don't hold the write lock on a shared connection
         finally:
-            conn.close()
+            self.user_cache.invalidate(user_id)
     
     def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user data"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        """Get user data (served from user_cache when fresh)"""
+        user = self.user_cache.get(user_id)
         
-        if row:
-            return {
+        if user is None:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            user = {
                 "user_id": row[0],
                 "username": row[1],
                 "first_name": row[2],
@@ -181,60 +516,222 @@ class Database:
                 "joined_at": row[9],
                 "last_activity": row[10]
             }
-        return None
+            self.user_cache.set(user_id, user)
+        
+        # Copy so callers can't mutate the cached record
+        user = dict(user)
+        user["last_activity"] = self._activity_buffer.get(user_id, user["last_activity"])
+        return user
+    
+    def buffer_activity(self, user_id: int) -> bool:
+        """
+        Record activity in memory only (coalesced per user).
+        Returns True when the buffer reached its flush threshold.
+        """
+        with self._activity_lock:
+            self._activity_buffer[user_id] = self.now()
+            return len(self._activity_buffer) >= config.ACTIVITY_FLUSH_THRESHOLD
     
     def update_activity(self, user_id: int):
-        """Update last activity timestamp"""
+        """Update last activity timestamp (write-behind, see flush_activity)"""
+        if self.buffer_activity(user_id):
+            self.flush_activity()
+    
+    def flush_activity(self) -> int:
+        """Write all buffered activity in one transaction; returns rows flushed"""
+        with self._activity_lock:
+            pending = self._activity_buffer
+            self._activity_buffer = {}
+        if not pending:
+            return 0
+        
+        conn = self.get_connection()
+        try:
+            with conn:
+                conn.executemany("""
+                    UPDATE users SET last_activity = ?
+                    WHERE user_id = ?
+                """, [(ts, user_id) for user_id, ts in pending.items()])
+        except sqlite3.Error:
+            # Put the batch back (newer touches win) so the next flush retries it
+            with self._activity_lock:
+                for user_id, ts in pending.items():
+                    self._activity_buffer.setdefault(user_id, ts)
+            raise
+        return len(pending)
+    
+    def get_user_bots(self, user_id: int) -> List[BotRecord]:
+        """Get all bots for a user (newest first, from the registry)"""
+        return self.bots.for_user(user_id)
+    
+    def get_bot(self, bot_id: int, user_id: Optional[int] = None) -> Optional[BotRecord]:
+        """Look up a bot by id; with user_id, only if that user owns it"""
+        if user_id is None:
+            return self.bots.get(bot_id)
+        return self.bots.get_owned(user_id, bot_id)
+    
+    def get_slot_quota(self, user_id: int) -> Optional[Dict]:
+        """Allowed and used bot slots in one aggregate query (None if no such user)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            UPDATE users SET last_activity = CURRENT_TIMESTAMP
-            WHERE user_id = ?
-        """, (user_id,))
+            SELECT CASE WHEN u.is_premium = 1 THEN ? ELSE ? + u.bonus_slots END,
+                   (SELECT COUNT(*) FROM hosted_bots WHERE user_id = u.user_id)
+            FROM users u WHERE u.user_id = ?
+        """, (config.PREMIUM_BOT_SLOTS, config.FREE_BOT_SLOTS, user_id))
+        row = cursor.fetchone()
+        
+        if row:
+            return {"allowed": row[0], "used": row[1]}
+        return None
+    
+    def add_bot(self, user_id: int, bot_name: str, file_path: str, source_type: str = "upload", git_url: Optional[str] = None) -> Optional[int]:
+        """
+        Add new bot to database.
+        The slot quota is checked inside the INSERT itself, so concurrent
+        uploads can't overshoot it. Returns None when no slot is free.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        created_at = self.now()
+        cursor.execute("""
+            INSERT INTO hosted_bots (user_id, bot_name, file_path, source_type, git_url, created_at)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE (SELECT COUNT(*) FROM hosted_bots WHERE user_id = ?) < (
+                SELECT CASE WHEN is_premium = 1 THEN ? ELSE ? + bonus_slots END
+                FROM users WHERE user_id = ?
+            )
+        """, (user_id, bot_name, file_path, source_type, git_url, created_at,
+              user_id, config.PREMIUM_BOT_SLOTS, config.FREE_BOT_SLOTS, user_id))
         conn.commit()
-        conn.close()
+        
+        if not cursor.rowcount:
+            return None
+        
+        bot_id = cursor.lastrowid
+        self.bots.add(BotRecord(
+            bot_id, user_id, bot_name, file_path, None, "stopped",
+            created_at, None, 0, source_type, git_url, None, None
+        ))
+        return bot_id
     
-    def get_user_bots(self, user_id: int) -> List[Dict]:
-        """Get all bots for a user"""
+    def get_bot_file_path(self, bot_id: int) -> Optional[str]:
+        """Get the entry file of a bot"""
+        record = self.bots.get(bot_id)
+        return record.file_path if record else None
+    
+    def mark_bot_running(self, bot_id: int, process_id: int):
+        """Record a successful bot start"""
+        last_start = self.now()
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT id, bot_name, file_path, process_id, status, created_at, 
-                   last_start, total_starts, source_type, git_url
-            FROM hosted_bots WHERE user_id = ?
-            ORDER BY created_at DESC
-        """, (user_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [
-            {
-                "id": row[0],
-                "bot_name": row[1],
-                "file_path": row[2],
-                "process_id": row[3],
-                "status": row[4],
-                "created_at": row[5],
-                "last_start": row[6],
-                "total_starts": row[7],
-                "source_type": row[8],
-                "git_url": row[9]
-            }
-            for row in rows
-        ]
+            UPDATE hosted_bots 
+            SET process_id = ?, status = 'running', 
+                last_start = ?,
+                total_starts = total_starts + 1
+            WHERE id = ?
+        """, (process_id, last_start, bot_id))
+        conn.commit()
+        
+        record = self.bots.get(bot_id)
+        if record:
+            record.process_id = process_id
+            record.status = "running"
+            record.last_start = last_start
+            record.total_starts += 1
+    
+    def mark_bot_stopped(self, bot_id: int):
+        """Record a bot stop"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE hosted_bots SET status = 'stopped', process_id = NULL
+            WHERE id = ?
+        """, (bot_id,))
+        conn.commit()
+        
+        record = self.bots.get(bot_id)
+        if record:
+            record.process_id = None
+            record.status = "stopped"
     
-    def add_bot(self, user_id: int, bot_name: str, file_path: str, source_type: str = "upload", git_url: Optional[str] = None) -> int:
-        """Add new bot to database"""
+    def mark_bot_exited(self, bot_id: int, exit_code: Optional[int], status: str):
+        """Record an unrequested process exit ('exited', 'crashed' or 'crashloop')"""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO hosted_bots (user_id, bot_name, file_path, source_type, git_url)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, bot_name, file_path, source_type, git_url))
+            UPDATE hosted_bots SET status = ?, process_id = NULL, last_exit_code = ?
+            WHERE id = ?
+        """, (status, exit_code, bot_id))
         conn.commit()
-        bot_id = cursor.lastrowid
-        conn.close()
-        return bot_id
+        
+        record = self.bots.get(bot_id)
+        if record:
+            record.process_id = None
+            record.status = status
+            record.last_exit_code = exit_code
+    
+    def mark_bots_stopped(self, bot_ids: List[int]):
+        """Record many stops in one transaction"""
+        if not bot_ids:
+            return
+        conn = self.get_connection()
+        with conn:
+            conn.executemany("""
+                UPDATE hosted_bots SET status = 'stopped', process_id = NULL
+                WHERE id = ?
+            """, [(bot_id,) for bot_id in bot_ids])
+        
+        for bot_id in bot_ids:
+            record = self.bots.get(bot_id)
+            if record:
+                record.process_id = None
+                record.status = "stopped"
+    
+    def set_restart_policy(self, bot_id: int, policy: str):
+        """Set a bot's restart policy (always / on-failure / never)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE hosted_bots SET restart_policy = ? WHERE id = ?", (policy, bot_id))
+        conn.commit()
+        
+        record = self.bots.get(bot_id)
+        if record:
+            record.restart_policy = policy
+    
+    def delete_bot(self, bot_id: int):
+        """Remove a bot row"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM hosted_bots WHERE id = ?", (bot_id,))
+        cursor.execute("DELETE FROM bot_errors WHERE bot_id = ?", (bot_id,))
+        conn.commit()
+        self.bots.remove(bot_id)
+    
+    def get_referral_count(self, user_id: int) -> int:
+        """Count users referred by user_id"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM referrals WHERE referrer_id = ?", (user_id,))
+        return cursor.fetchone()[0]
+    
+    def get_active_user_ids(self) -> List[int]:
+        """All non-banned user IDs (broadcast targets)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM users WHERE is_banned = 0")
+        return [row[0] for row in cursor.fetchall()]
+    
+    def get_expired_premiums(self) -> List[Tuple[int, str]]:
+        """(user_id, first_name) of users whose premium has run out"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT user_id, first_name FROM users
+            WHERE is_premium = 1 AND premium_until < datetime('now')
+        """)
+        return cursor.fetchall()
     
     def add_premium(self, user_id: int, duration_str: str) -> Tuple[bool, str]:
         """Add premium subscription"""
@@ -254,7 +751,7 @@ class Database:
             WHERE user_id = ?
         """, (premium_until, user_id))
         conn.commit()
-        conn.close()
+        self.user_cache.invalidate(user_id)
         
         return True, f"Premium active until {premium_until[:16]}"
     
@@ -267,7 +764,7 @@ class Database:
             WHERE user_id = ?
         """, (user_id,))
         conn.commit()
-        conn.close()
+        self.user_cache.invalidate(user_id)
     
     def ban_user(self, user_id: int, reason: str = "Violation of terms"):
         """Ban user"""
@@ -278,7 +775,7 @@ class Database:
             WHERE user_id = ?
         """, (reason, user_id))
         conn.commit()
-        conn.close()
+        self.user_cache.invalidate(user_id)
     
     def unban_user(self, user_id: int):
         """Unban user"""
@@ -289,7 +786,55 @@ class Database:
             WHERE user_id = ?
         """, (user_id,))
         conn.commit()
-        conn.close()
+        self.user_cache.invalidate(user_id)
+    
+    def record_errors(self, batch: List[tuple]) -> List[int]:
+        """
+        Add crash occurrences, one row per (bot_id, fingerprint):
+        (bot_id, fingerprint, exc_type, message, frames, sample, count, first_seen, last_seen).
+        Returns the new total count of each, in batch order.
+        """
+        conn = self.get_connection()
+        totals = []
+        try:
+            for row in batch:
+                totals.append(conn.execute("""
+                    INSERT INTO bot_errors
+                        (bot_id, fingerprint, exc_type, message, frames, sample, count, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (bot_id, fingerprint) DO UPDATE SET
+                        count = count + excluded.count,
+                        message = excluded.message,
+                        sample = excluded.sample,
+                        last_seen = excluded.last_seen
+                    RETURNING count
+                """, row).fetchone()[0])
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        return totals
+    
+    def get_top_errors(self, bot_id: Optional[int] = None, user_id: Optional[int] = None,
+                       limit: int = 10) -> List[Dict]:
+        """Most frequent crash fingerprints for one bot, one user's bots, or everything"""
+        conn = self.get_connection()
+        where, params = "", ()
+        if bot_id is not None:
+            where, params = "WHERE e.bot_id = ?", (bot_id,)
+        elif user_id is not None:
+            where, params = "WHERE b.user_id = ?", (user_id,)
+        cursor = conn.execute(f"""
+            SELECT e.bot_id, b.bot_name, e.exc_type, e.message, e.frames,
+                   e.count, e.first_seen, e.last_seen
+            FROM bot_errors e
+            JOIN hosted_bots b ON b.id = e.bot_id
+            {where}
+            ORDER BY e.count DESC, e.last_seen DESC
+            LIMIT ?
+        """, (*params, limit))
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
     def log_admin_action(self, admin_id: int, action: str, target_user_id: int, details: str):
         """Log admin actions"""
@@ -300,37 +845,92 @@ class Database:
             VALUES (?, ?, ?, ?)
         """, (admin_id, action, target_user_id, details))
         conn.commit()
-        conn.close()
+    
+    # Ground-truth queries for each counter in stats_counters
+    STATS_QUERIES: Dict[str, str] = {
+        "total_users": "SELECT COUNT(*) FROM users",
+        "premium_users": "SELECT COUNT(*) FROM users WHERE is_premium = 1",
+        "active_bots": "SELECT COUNT(*) FROM hosted_bots WHERE status = 'running'",
+        "total_bots": "SELECT COUNT(*) FROM hosted_bots",
+        "total_referrals": "SELECT COUNT(*) FROM referrals"
+    }
     
     def get_stats(self) -> Dict:
-        """Get system statistics"""
+        """Get system statistics (O(1) read of trigger-maintained counters)"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_premium = 1")
-        premium_users = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM hosted_bots WHERE status = 'running'")
-        active_bots = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM hosted_bots")
-        total_bots = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM referrals")
-        total_referrals = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            "total_users": total_users,
-            "premium_users": premium_users,
-            "active_bots": active_bots,
-            "total_bots": total_bots,
-            "total_referrals": total_referrals
-        }
+        cursor.execute("SELECT name, value FROM stats_counters")
+        counters = dict(cursor.fetchall())
+        return {name: counters.get(name, 0) for name in self.STATS_QUERIES}
+    
+    def reconcile_stats(self) -> Dict[str, int]:
+        """
+        Recount every stat from the real tables and overwrite the counters.
+        Returns {name: drift} for counters that were off.
+        """
+        conn = self.get_connection()
+        drift = {}
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            counters = dict(conn.execute("SELECT name, value FROM stats_counters").fetchall())
+            for name, sql in self.STATS_QUERIES.items():
+                actual = conn.execute(sql).fetchone()[0]
+                if counters.get(name) != actual:
+                    drift[name] = actual - counters.get(name, 0)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)",
+                        (name, actual)
+                    )
+        return drift
+
+class AsyncDatabase:
+    """
+    Awaitable facade over Database.
+    Every call is queued to one dedicated DB thread, so a commit/fsync
+    never blocks the event loop (polling and bot supervision keep running).
+    Usage: `await db.get_user(user_id)` - same names as Database.
+    """
+
+    def __init__(self, database: Database):
+        self.sync = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+    async def run(self, func, *args, **kwargs):
+        """Run any callable on the DB thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    # Registry reads are pure memory lookups - answer on the loop thread
+    async def get_user_bots(self, user_id: int) -> List[BotRecord]:
+        return self.sync.get_user_bots(user_id)
+
+    async def get_bot(self, bot_id: int, user_id: Optional[int] = None) -> Optional[BotRecord]:
+        return self.sync.get_bot(bot_id, user_id)
+
+    async def get_bot_file_path(self, bot_id: int) -> Optional[str]:
+        return self.sync.get_bot_file_path(bot_id)
+
+    async def update_activity(self, user_id: int):
+        """Buffered on the loop thread - only hops to the DB thread when a batch is full"""
+        if self.sync.buffer_activity(user_id):
+            await self.run(self.sync.flush_activity)
+
+    async def close(self):
+        """Flush buffers, drain pending queries, close connections and stop the DB thread"""
+        await self.run(self.sync.flush_activity)
+        await self.run(self.sync.close)
+        self._executor.shutdown(wait=True)
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 🛡️ SYNTAX GUARD - Military-Grade Code Validator
@@ -377,155 +977,2509 @@ class SyntaxGuard:
             return False, f"❌ <b>Validation Error!</b>\n\n{str(e)}", []
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-# 🚀 ADVANCED BOT PROCESS MANAGER
+# 🧱 RESOURCE LIMITER - Per-Tier Sandboxing
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-class BotManager:
-    running_processes: Dict[int, asyncio.subprocess.Process] = {}
+class ResourceLimiter:
+    """
+    Applies config.RESOURCE_LIMITS to a bot before its code runs.
+    Exec'd processes start as a `python -c` shim (EXEC_SHIM) that joins
+    the bot's cgroup v2 (optional), sets its rlimits and then execv's the
+    real command, so no instant runs unlimited (a preexec_fn would run
+    Python code between fork and exec while the DB thread holds locks,
+    which is not fork-safe). Forkserver children apply the same limits
+    themselves right after the fork.
+    """
+    # bot_id -> memory.events oom_kill count at spawn
+    oom_baseline: Dict[int, int] = {}
+    
+    RLIMITS = (
+        ("memory_mb", "RLIMIT_AS", 1024 * 1024),
+        ("cpu_seconds", "RLIMIT_CPU", 1),
+        ("open_files", "RLIMIT_NOFILE", 1),
+        ("processes", "RLIMIT_NPROC", 1),
+    )
+    
+    # argv: shim <limits json> <command...>; failures are reported in the bot's log
+    EXEC_SHIM = (
+        "import json, os, resource, sys\n"
+        "limits = json.loads(sys.argv[1])\n"
+        "if limits['cgroup']:\n"
+        "    try:\n"
+        "        with open(limits['cgroup'], 'w') as f:\n"
+        "            f.write(str(os.getpid()))\n"
+        "    except OSError as e:\n"
+        "        print(f'limits: cgroup placement failed: {e}', file=sys.stderr)\n"
+        "for name, soft, hard in limits['rlimits']:\n"
+        "    try:\n"
+        "        resource.setrlimit(getattr(resource, name), (soft, hard))\n"
+        "    except (OSError, ValueError) as e:\n"
+        "        print(f'limits: {name} not applied: {e}', file=sys.stderr)\n"
+        "os.execv(sys.executable, [sys.executable, *sys.argv[2:]])\n"
+    )
+    
+    @staticmethod
+    def get_limits(tier: str) -> Dict:
+        return config.RESOURCE_LIMITS.get(tier, config.RESOURCE_LIMITS["free"])
+    
+    @staticmethod
+    def cgroup_path(bot_id: int) -> Optional[str]:
+        if not config.CGROUP_ROOT or not os.path.isdir(config.CGROUP_ROOT):
+            return None
+        return os.path.join(config.CGROUP_ROOT, f"bot_{bot_id}")
+    
+    @staticmethod
+    def prepare(bot_id, tier: str) -> Optional[Dict]:
+        """
+        Set up the bot's cgroup and work out its rlimits:
+        {"rlimits": [[name, soft, hard], ...], "cgroup": cgroup.procs path or None},
+        or None when there is nothing to apply. Best effort: a platform
+        without rlimits/cgroups just runs unlimited.
+        """
+        limits = ResourceLimiter.get_limits(tier)
+        
+        rlimits = []
+        if os.name == "posix":
+            for key, rlimit_name, scale in ResourceLimiter.RLIMITS:
+                if limits.get(key) is not None:
+                    soft = limits[key] * scale
+                    # CPU: hard == soft would SIGKILL instead of the
+                    # recognisable SIGXCPU, so leave a few seconds of headroom
+                    hard = soft + 5 if rlimit_name == "RLIMIT_CPU" else soft
+                    rlimits.append([rlimit_name, soft, hard])
+        
+        procs = None
+        cgroup = ResourceLimiter.cgroup_path(bot_id)
+        if cgroup:
+            try:
+                os.makedirs(cgroup, exist_ok=True)
+                settings = {
+                    "memory.max": limits.get("memory_mb") and limits["memory_mb"] * 1024 * 1024,
+                    "pids.max": limits.get("processes"),
+                    "cpu.max": limits.get("cpu_percent") and f"{limits['cpu_percent'] * 1000} 100000",
+                }
+                for name, value in settings.items():
+                    with open(os.path.join(cgroup, name), 'w') as f:
+                        f.write(str(value) if value else "max")
+                ResourceLimiter.oom_baseline[bot_id] = ResourceLimiter._oom_kills(cgroup)
+                procs = os.path.join(cgroup, "cgroup.procs")
+            except OSError as e:
+                logger.warning(f"⚠️ Bot {bot_id}: cgroup setup failed: {e}")
+        
+        if not rlimits and not procs:
+            return None
+        return {"rlimits": rlimits, "cgroup": procs}
+    
+    @staticmethod
+    def command(args: List[str], bot_id, tier: str) -> List[str]:
+        """args ([python, script, ...]) wrapped in EXEC_SHIM so the limits hold from exec on"""
+        limits = ResourceLimiter.prepare(bot_id, tier)
+        if limits is None:
+            return args
+        return [args[0], "-c", ResourceLimiter.EXEC_SHIM, json.dumps(limits), *args[1:]]
+    
+    @staticmethod
+    def _oom_kills(cgroup: str) -> int:
+        try:
+            with open(os.path.join(cgroup, "memory.events")) as f:
+                for line in f:
+                    key, _, value = line.partition(" ")
+                    if key == "oom_kill":
+                        return int(value)
+        except (OSError, ValueError):
+            pass
+        return 0
+    
+    @staticmethod
+    def describe_violation(bot_id: int, exit_code: Optional[int]) -> Optional[str]:
+        """Which limit (if any) ended the process"""
+        if exit_code == -signal.SIGXCPU:
+            return "CPU time limit exceeded"
+        
+        cgroup = ResourceLimiter.cgroup_path(bot_id)
+        if cgroup and ResourceLimiter._oom_kills(cgroup) > ResourceLimiter.oom_baseline.get(bot_id, 0):
+            return "memory limit exceeded (OOM-killed)"
+        
+        if exit_code:
+            # RLIMIT_AS surfaces as a Python MemoryError traceback
+            last_traceback = OutputMux.last_traceback(bot_id)
+            if last_traceback and "MemoryError" in last_traceback.splitlines()[-1]:
+                return "memory limit exceeded"
+        return None
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🗃️ LOG STORAGE - Capped, Rotating, Compressed
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class LogStore:
+    """
+    LOGS_DIR/bot_<id>.log is the active file, appended to across restarts
+    (by the bot itself, O_APPEND, and followed by OutputMux). Past
+    LOG_MAX_BYTES it is gzipped into bot_<id>.log.<timestamp>.gz and
+    truncated in place (copytruncate, so the running bot keeps writing to
+    it). Segments past LOG_KEEP_SEGMENTS or older than LOG_RETENTION_DAYS
+    are deleted.
+    """
+    
+    @staticmethod
+    def path(bot_id: int) -> str:
+        return os.path.join(config.LOGS_DIR, f"bot_{bot_id}.log")
+    
+    @staticmethod
+    def segments(bot_id: int) -> List[str]:
+        """Compressed segments, oldest first"""
+        return sorted(glob.glob(glob.escape(LogStore.path(bot_id)) + ".*.gz"))
+    
+    @staticmethod
+    def append(bot_id: int, data: bytes):
+        """Append controller text; it is indexed when read back like the bot's output (blocking)"""
+        with open(LogStore.path(bot_id), 'ab') as f:
+            f.write(data)
+    
+    @staticmethod
+    def read_from(bot_id: int, fd: Optional[int], offset: int) -> Tuple[bytes, int]:
+        """
+        Output appended to the active file since `offset` (at most
+        OUTPUT_READ_BYTES), indexed; once all of it is read, a full file is
+        rotated. fd: an open read fd, else the file is opened.
+        Returns (data, new offset) (blocking).
+        """
+        path = LogStore.path(bot_id)
+        try:
+            size = os.fstat(fd).st_size if fd is not None else os.path.getsize(path)
+            if size < offset:
+                offset = 0  # Truncated by a rotation
+            data = b""
+            if size > offset:
+                count = min(size - offset, config.OUTPUT_READ_BYTES)
+                if fd is not None:
+                    data = os.pread(fd, count, offset)
+                else:
+                    with open(path, 'rb') as f:
+                        f.seek(offset)
+                        data = f.read(count)
+                offset += len(data)
+                LogIndex.add(bot_id, data)
+            if offset == size and LogStore.rotate(bot_id):
+                offset = 0
+        except OSError as e:
+            logger.error(f"Log read failed for bot {bot_id}: {e}")
+            return b"", offset
+        return data, offset
+    
+    @staticmethod
+    def rotate(bot_id: int, force: bool = False) -> bool:
+        """Compress the active file into a segment if it is over the cap (blocking)"""
+        path = LogStore.path(bot_id)
+        try:
+            if not force and os.path.getsize(path) < config.LOG_MAX_BYTES:
+                return False
+        except OSError:
+            return False
+        
+        segment = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.gz"
+        with open(path, 'rb') as src, gzip.open(segment + ".tmp", 'wb', compresslevel=config.LOG_COMPRESS_LEVEL) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        # Lines written between the copy and here are lost; the window is tiny
+        os.truncate(path, 0)
+        os.replace(segment + ".tmp", segment)
+        LogStore.prune(bot_id)
+        return True
+    
+    @staticmethod
+    def prune(bot_id: int) -> int:
+        """Apply segment retention by count and age"""
+        segments = LogStore.segments(bot_id)
+        cutoff = time.time() - config.LOG_RETENTION_DAYS * 86400
+        doomed = segments[:max(0, len(segments) - config.LOG_KEEP_SEGMENTS)]
+        doomed += [s for s in segments[len(doomed):] if os.path.getmtime(s) < cutoff]
+        newest_gone = 0.0
+        for segment in doomed:
+            try:
+                newest_gone = max(newest_gone, os.path.getmtime(segment))
+                os.remove(segment)
+            except OSError:
+                pass
+        if newest_gone:
+            # Everything in a deleted segment was written before it was closed
+            LogIndex.prune(bot_id, newest_gone)
+        return len(doomed)
+    
+    @staticmethod
+    def rotate_all() -> int:
+        """Rotate every oversized bot log and expire old segments (blocking)"""
+        rotated = 0
+        for name in os.listdir(config.LOGS_DIR):
+            match = re.fullmatch(r"bot_(\d+)\.log", name)
+            if not match:
+                continue
+            bot_id = int(match.group(1))
+            try:
+                rotated += LogStore.rotate(bot_id)
+                LogStore.prune(bot_id)
+            except OSError as e:
+                logger.error(f"Log rotation failed for bot {bot_id}: {e}")
+        return rotated
+    
+    @staticmethod
+    def _tail_file(f, lines: int, max_bytes: int, end: Optional[int] = None) -> Tuple[List[bytes], bool]:
+        """
+        Last lines of a seekable file (up to byte `end`), reading backwards
+        block by block, and whether the read reached the start of the file
+        """
+        f.seek(0, os.SEEK_END)
+        pos = f.tell() if end is None else min(end, f.tell())
+        chunks, size, newlines = [], 0, 0
+        # lines + 1 newlines: the last line usually ends with one
+        while pos > 0 and newlines <= lines and size < max_bytes:
+            step = min(config.LOG_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            size += len(chunk)
+            newlines += chunk.count(b"\n")
+        result = b"".join(reversed(chunks)).splitlines(keepends=True)
+        if pos > 0 and result:
+            result = result[1:]  # Started mid-line
+        return result[-lines:], pos == 0
+    
+    @staticmethod
+    def tail(bot_id: int, lines: int, max_bytes: int = 1024 * 1024, end: Optional[int] = None) -> Optional[str]:
+        """
+        Last `lines` lines across the active file and, if it was read whole
+        and is short, the newest segments. Costs O(bytes returned) on the active file; a gzip
+        segment can't be read backwards, so one is streamed at most once.
+        end: ignore active-file bytes from there on. None when the bot has
+        no logs at all (blocking).
+        """
+        result: List[bytes] = []
+        found = False
+        whole = True  # The active file was read to its start
+        try:
+            with open(LogStore.path(bot_id), 'rb') as f:
+                found = True
+                result, whole = LogStore._tail_file(f, lines, max_bytes, end)
+        except FileNotFoundError:
+            pass
+        
+        for segment in reversed(LogStore.segments(bot_id)):
+            # Stopped at max_bytes: segment lines would leave a gap
+            if len(result) >= lines or not whole:
+                break
+            found = True
+            try:
+                with gzip.open(segment, 'rb') as g:
+                    older = deque(g, maxlen=lines - len(result))
+            except (OSError, EOFError):
+                continue
+            result = list(older) + result
+        
+        if not found:
+            return None
+        return b"".join(result).decode('utf-8', errors='replace')
+    
+    @staticmethod
+    def read_page(bot_id: int, cursor: Optional[int], forward: bool) -> Tuple[bytes, int, int, int]:
+        """
+        One LOG_PAGE_BYTES page of the active file with a single seek + bounded
+        read, trimmed to whole lines. forward: the page starting at cursor;
+        else the page ending at cursor (None = end of file).
+        Returns (data, start, end, file size) (blocking).
+        """
+        path = LogStore.path(bot_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return b"", 0, 0, 0
+        
+        with open(path, 'rb') as f:
+            if forward:
+                start = min(cursor or 0, size)
+                f.seek(start)
+                data = f.read(config.LOG_PAGE_BYTES)
+                cut = data.rfind(b"\n")
+                if start + len(data) < size and cut >= 0:
+                    data = data[:cut + 1]
+                end = start + len(data)
+            else:
+                end = size if cursor is None else min(cursor, size)
+                start = max(0, end - config.LOG_PAGE_BYTES)
+                f.seek(start)
+                data = f.read(end - start)
+                cut = data.find(b"\n")
+                # Keep a partial line when it is all there is (a line longer than a page)
+                if start > 0 and 0 <= cut < len(data) - 1:
+                    data = data[cut + 1:]
+                start = end - len(data)
+        return data, start, end, size
+    
+    @staticmethod
+    def read_last(bot_id: int, max_bytes: int) -> bytes:
+        """Up to max_bytes of the newest output, reaching into segments if needed (blocking)"""
+        parts: List[bytes] = []
+        remaining = max_bytes
+        try:
+            with open(LogStore.path(bot_id), 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - remaining))
+                parts.append(f.read(remaining))
+                remaining -= len(parts[-1])
+        except FileNotFoundError:
+            pass
+        
+        for segment in reversed(LogStore.segments(bot_id)):
+            if remaining <= 0:
+                break
+            try:
+                with gzip.open(segment, 'rb') as g:
+                    data = g.read()[-remaining:]
+            except (OSError, EOFError):
+                continue
+            parts.insert(0, data)
+            remaining -= len(data)
+        return b"".join(parts)
+    
+    @staticmethod
+    def delete(bot_id: int):
+        """Remove the active log and all segments"""
+        for path in [LogStore.path(bot_id), *LogStore.segments(bot_id)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        LogIndex.delete(bot_id)
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🔎 LOG INDEX - Full-Text Search Over Bot Output
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class LogIndex:
+    """
+    SQLite FTS5 index over blocks of up to LOG_INDEX_BLOCK_LINES log lines,
+    in its own database (LOG_INDEX_PATH) so log volume never contends with
+    the main one. Fed by LogStore.read_from with each batch OutputMux reads,
+    pruned by LogStore.prune with the segments, so a search never touches
+    the log files. log_blocks holds (bot_id, ts) per block and shares its
+    rowid with log_fts. A batch's unterminated last line waits in `partial`
+    for the rest of it, so a line is never split across blocks. All methods
+    are blocking.
+    """
+    _local = threading.local()
+    partial: Dict[int, bytes] = {}
+    _connections: List[sqlite3.Connection] = []
+    _connections_lock = threading.Lock()
+    
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS log_blocks (
+            id INTEGER PRIMARY KEY,
+            bot_id INTEGER NOT NULL,
+            ts REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_log_blocks_bot_ts ON log_blocks (bot_id, ts)",
+        # bot holds the bot id as a token so MATCH narrows by bot inside the index
+        "CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(bot, body)",
+    ]
+    
+    TOKEN_RE = re.compile(r'\w+\*?')
+    
+    @staticmethod
+    def connection() -> sqlite3.Connection:
+        """The calling thread's connection (opened and schema-checked once per thread)"""
+        conn = getattr(LogIndex._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(config.LOG_INDEX_PATH, timeout=config.DB_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            for statement in LogIndex.SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            LogIndex._local.conn = conn
+            with LogIndex._connections_lock:
+                LogIndex._connections.append(conn)
+        return conn
+    
+    @staticmethod
+    def close():
+        with LogIndex._connections_lock:
+            for conn in LogIndex._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            LogIndex._connections.clear()
+        LogIndex._local = threading.local()
+    
+    @staticmethod
+    def add(bot_id: int, data: bytes, ts: Optional[float] = None, carry: bool = True):
+        """Index a batch of output, one row per block of complete lines"""
+        data = LogIndex.partial.pop(bot_id, b"") + data
+        if carry:
+            cut = data.rfind(b"\n") + 1
+            # A runaway unterminated line is indexed as is (as OutputMux clips it)
+            if cut < len(data) and len(data) - cut <= config.OUTPUT_MAX_LINE:
+                LogIndex.partial[bot_id] = data[cut:]
+                data = data[:cut]
+        lines = data.decode('utf-8', errors='replace').splitlines()
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            return
+        ts = time.time() if ts is None else ts
+        step = config.LOG_INDEX_BLOCK_LINES
+        
+        conn = LogIndex.connection()
+        try:
+            for i in range(0, len(lines), step):
+                rowid = conn.execute(
+                    "INSERT INTO log_blocks (bot_id, ts) VALUES (?, ?)", (bot_id, ts)
+                ).lastrowid
+                conn.execute(
+                    "INSERT INTO log_fts (rowid, bot, body) VALUES (?, ?, ?)",
+                    (rowid, str(bot_id), "\n".join(lines[i:i + step]))
+                )
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Log indexing failed for bot {bot_id}: {e}")
+    
+    @staticmethod
+    def prune(bot_id: int, before: float):
+        """Drop blocks written before `before` (their segment was deleted)"""
+        conn = LogIndex.connection()
+        conn.execute("""
+            DELETE FROM log_fts WHERE rowid IN
+                (SELECT id FROM log_blocks WHERE bot_id = ? AND ts <= ?)
+        """, (bot_id, before))
+        conn.execute("DELETE FROM log_blocks WHERE bot_id = ? AND ts <= ?", (bot_id, before))
+        conn.commit()
+    
+    @staticmethod
+    def delete(bot_id: int):
+        LogIndex.partial.pop(bot_id, None)
+        LogIndex.prune(bot_id, float("inf"))
+    
+    @staticmethod
+    def backfill() -> int:
+        """Index the active log of bots with no blocks yet (logs from before the index)"""
+        conn = LogIndex.connection()
+        indexed = 0
+        for name in os.listdir(config.LOGS_DIR):
+            match = re.fullmatch(r"bot_(\d+)\.log", name)
+            if not match:
+                continue
+            bot_id = int(match.group(1))
+            if conn.execute("SELECT 1 FROM log_blocks WHERE bot_id = ? LIMIT 1", (bot_id,)).fetchone():
+                continue
+            path = LogStore.path(bot_id)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read(config.LOG_MAX_BYTES)
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            LogIndex.add(bot_id, data, mtime, carry=False)
+            indexed += 1
+        return indexed
+    
+    @staticmethod
+    def build_query(query: str) -> Optional[str]:
+        """User text -> FTS5 expression: every word must match, `word*` is a prefix"""
+        terms = []
+        for token in LogIndex.TOKEN_RE.findall(query):
+            word = token.rstrip("*")
+            terms.append(f'"{word}"' + ("*" if token.endswith("*") else ""))
+        return " AND ".join(terms) or None
+    
+    @staticmethod
+    def search(bot_id: int, query: str, limit: int) -> List[Tuple[float, List[str]]]:
+        """
+        Newest matches first: (block timestamp, matching lines with
+        LOG_SEARCH_CONTEXT lines around them, from the same block).
+        """
+        expression = LogIndex.build_query(query)
+        if expression is None:
+            return []
+        
+        words = [w.rstrip("*").lower() for w in LogIndex.TOKEN_RE.findall(query)]
+        context = config.LOG_SEARCH_CONTEXT
+        rows = LogIndex.connection().execute("""
+            SELECT b.ts, f.body FROM log_fts f
+            JOIN log_blocks b ON b.id = f.rowid
+            WHERE log_fts MATCH ?
+            ORDER BY f.rowid DESC
+            LIMIT ?
+        """, (f'bot : "{bot_id}" AND body : ({expression})', limit)).fetchall()
+        
+        results = []
+        for ts, body in rows:
+            lines = body.split("\n")
+            hits = [i for i, line in enumerate(lines) if any(w in line.lower() for w in words)]
+            keep = sorted({j for i in hits for j in range(max(0, i - context), min(len(lines), i + context + 1))})
+            results.append((ts, [lines[j] for j in keep] or lines[:1 + 2 * context]))
+        return results
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🔀 OUTPUT MULTIPLEXER - Followed Bot Output
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class BotOutput:
+    """Per-bot output state: recent lines in memory, how far the log has been read"""
+    __slots__ = ("ring", "partial", "offset", "fd",
+                 "ready", "ready_marker", "traceback", "traceback_seen", "last_traceback")
+    
+    def __init__(self, lines: List[str], offset: int):
+        self.ring: deque = deque(lines, maxlen=config.OUTPUT_RING_LINES)
+        self.partial = b""
+        self.offset = offset  # Bytes of the active log file consumed so far
+        self.fd: Optional[int] = None  # Read fd while the bot is followed
+        # Per run (reset by attach)
+        self.ready = asyncio.Event()
+        self.ready_marker: Optional[str] = None
+        self.traceback: Optional[deque] = None  # Last lines of a traceback being captured
+        self.traceback_seen = 0  # Lines since its header
+        self.last_traceback: Optional[str] = None
+
+class OutputMux:
+    """
+    Bots write stdout/stderr straight into their log file (O_APPEND), so
+    their output channel outlives the controller and a restarted one can
+    re-adopt them. The controller follows the files of running bots: every
+    OUTPUT_POLL_INTERVAL one thread hop reads what each appended (at most
+    OUTPUT_READ_BYTES), feeds it to LogIndex and rotates full files. New
+    output lands in an in-memory ring of OUTPUT_RING_LINES lines per bot
+    (seeded from disk), so log views need no disk read. Complete lines are
+    scanned for events: "ready" (a READY_MARKERS line) and "traceback" (a
+    full Python traceback). Listeners are called as listener(bot_id, kind, text).
+    
+    Controller notices (host_notice) are appended to the same file on a
+    line of their own.
+    """
+    outputs: Dict[int, BotOutput] = {}
+    listeners: List = []
+    _poller: Optional[asyncio.Task] = None
+    _read_lock: Optional[asyncio.Lock] = None
+    
+    @staticmethod
+    async def attach(bot_id: int) -> int:
+        """
+        Output fd for a starting bot: its log file opened O_APPEND, to hand
+        to the child (the caller closes it after spawn). Following starts at once.
+        """
+        await OutputMux.follow(bot_id)
+        # What an earlier run left behind must not count for this one
+        await OutputMux.flush(bot_id)
+        output = OutputMux.outputs[bot_id]
+        output.ready = asyncio.Event()
+        output.ready_marker = None
+        output.traceback = None
+        output.last_traceback = None
+        return os.open(LogStore.path(bot_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    
+    @staticmethod
+    async def follow(bot_id: int) -> BotOutput:
+        """Read the bot's new output as it is written (a started or re-adopted bot)"""
+        output = await OutputMux._get(bot_id)
+        if output.fd is None:
+            output.fd = os.open(LogStore.path(bot_id), os.O_RDONLY | os.O_CREAT, 0o644)
+        if OutputMux._poller is None or OutputMux._poller.done():
+            OutputMux._poller = asyncio.create_task(OutputMux._poll())
+        return output
+    
+    @staticmethod
+    async def unfollow(bot_id: int):
+        # Under the read lock: a read in flight must not see the fd number reused
+        async with OutputMux._lock():
+            output = OutputMux.outputs.get(bot_id)
+            if output and output.fd is not None:
+                fd, output.fd = output.fd, None
+                os.close(fd)
+    
+    @staticmethod
+    def _lock() -> asyncio.Lock:
+        """Serializes reads of the followed files"""
+        if OutputMux._read_lock is None:
+            OutputMux._read_lock = asyncio.Lock()
+        return OutputMux._read_lock
+    
+    @staticmethod
+    async def _get(bot_id: int) -> BotOutput:
+        """The bot's output state, created (ring seeded from disk) on first use"""
+        output = OutputMux.outputs.get(bot_id)
+        if output is None:
+            def seed() -> Tuple[str, int]:
+                try:
+                    size = os.path.getsize(LogStore.path(bot_id))
+                except OSError:
+                    size = 0
+                # Bytes past `size` are left for the first read
+                return LogStore.tail(bot_id, config.OUTPUT_RING_LINES, end=size) or "", size
+            
+            text, size = await asyncio.to_thread(seed)
+            # Split on "\n" only, so the ring stays byte-for-byte the file's tail
+            lines = text.split("\n")
+            seeded = BotOutput(lines[:-1], size)
+            seeded.partial = lines[-1].encode()  # The file may end mid-line
+            # Another caller may have created it while we read
+            output = OutputMux.outputs.setdefault(bot_id, seeded)
+        return output
+    
+    @staticmethod
+    async def _poll():
+        """Read every followed bot's new output, one thread hop per round"""
+        while True:
+            await asyncio.sleep(config.OUTPUT_POLL_INTERVAL)
+            followed = [(bot_id, output) for bot_id, output in OutputMux.outputs.items() if output.fd is not None]
+            if not followed:
+                continue
+            try:
+                async with OutputMux._lock():
+                    results = await asyncio.to_thread(
+                        lambda: [LogStore.read_from(bot_id, output.fd, output.offset) for bot_id, output in followed]
+                    )
+                    for (bot_id, output), (data, offset) in zip(followed, results):
+                        output.offset = offset
+                        OutputMux._consume(bot_id, output, data)
+            except Exception as e:
+                logger.error(f"Output poll failed: {e}")
+    
+    @staticmethod
+    def _consume(bot_id: int, output: BotOutput, data: bytes):
+        """New bytes of the log: keep in memory, scan"""
+        if not data:
+            return
+        lines = (output.partial + data).split(b"\n")
+        output.partial = lines.pop()[-config.OUTPUT_MAX_LINE:]
+        for raw in lines:
+            line = raw.decode('utf-8', errors='replace')
+            output.ring.append(line)
+            OutputMux._scan(bot_id, output, line.rstrip("\r"))
+    
+    @staticmethod
+    async def host_notice(bot_id: int, text: str):
+        """A controller line in the bot's log"""
+        await OutputMux._get(bot_id)
+        notice = f"\n[HOST {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {text}\n".encode()
+        try:
+            await asyncio.to_thread(LogStore.append, bot_id, notice)
+        except OSError as e:
+            logger.error(f"Log write failed for bot {bot_id}: {e}")
+        await OutputMux.flush(bot_id)
+    
+    @staticmethod
+    def _scan(bot_id: int, output: BotOutput, line: str):
+        """Readiness markers and tracebacks"""
+        if output.traceback is not None:
+            output.traceback.append(line)
+            output.traceback_seen += 1
+            # The first unindented line after the frames is the exception itself
+            if line and not line[0].isspace():
+                text = "\n".join(output.traceback)
+                output.traceback = None
+                output.last_traceback = text
+                logger.warning(f"🐞 Bot {bot_id} traceback: {line[:200]}")
+                OutputMux._emit(bot_id, "traceback", text)
+            elif output.traceback_seen >= config.OUTPUT_TRACEBACK_GIVE_UP_LINES:
+                output.traceback = None  # Indented output that only looked like a traceback
+        elif line.startswith("Traceback (most recent call last):"):
+            output.traceback = deque([line], maxlen=config.OUTPUT_MAX_TRACEBACK_LINES)
+            output.traceback_seen = 1
+        
+        if not output.ready.is_set():
+            for marker in config.READY_MARKERS:
+                if marker in line:
+                    output.ready_marker = marker
+                    output.ready.set()
+                    OutputMux._emit(bot_id, "ready", line)
+                    break
+    
+    @staticmethod
+    def _emit(bot_id: int, kind: str, text: str):
+        for listener in OutputMux.listeners:
+            try:
+                listener(bot_id, kind, text)
+            except Exception as e:
+                logger.error(f"Output listener error ({kind}, bot {bot_id}): {e}")
+    
+    @staticmethod
+    async def flush(bot_id: int):
+        """Read the bot's new output now, so views and the index are current"""
+        output = OutputMux.outputs.get(bot_id)
+        if output is None:
+            return
+        async with OutputMux._lock():
+            data, output.offset = await asyncio.to_thread(LogStore.read_from, bot_id, output.fd, output.offset)
+            OutputMux._consume(bot_id, output, data)
+    
+    @staticmethod
+    async def flush_all():
+        await asyncio.gather(*(OutputMux.flush(bot_id) for bot_id in list(OutputMux.outputs)))
+    
+    @staticmethod
+    async def drain(bot_id: int):
+        """The bot exited: read the last of its output (e.g. the final traceback), stop following"""
+        await OutputMux.flush(bot_id)
+        await OutputMux.unfollow(bot_id)
+    
+    @staticmethod
+    def tail(bot_id: int, lines: int) -> Optional[str]:
+        """Last lines from memory, None if the ring can't answer"""
+        output = OutputMux.outputs.get(bot_id)
+        if output is None or lines > config.OUTPUT_RING_LINES:
+            return None
+        recent = list(output.ring)[-lines:]
+        if output.partial:
+            recent = recent[1:] if len(recent) == lines else recent
+            recent.append(output.partial.decode('utf-8', errors='replace'))
+        return "\n".join(recent) + ("\n" if recent and not output.partial else "")
+    
+    @staticmethod
+    def newest_page(bot_id: int) -> Optional[Tuple[bytes, int, int, int]]:
+        """
+        LogStore.read_page(bot_id, None, False) answered from the ring, as of
+        the output read so far. None when the ring can't stand in for the
+        file's tail.
+        """
+        text = OutputMux.tail(bot_id, config.OUTPUT_RING_LINES)
+        # A lossy decode would make the byte cursors drift
+        if text is None or "\ufffd" in text:
+            return None
+        size = OutputMux.outputs[bot_id].offset
+        data = text.encode()
+        page = data[-config.LOG_PAGE_BYTES:]
+        if len(page) > size:
+            return None  # The ring reaches back before a rotation
+        cut = page.find(b"\n")
+        # Same trimming as read_page: whole lines, unless one line fills the page
+        if len(page) < len(data) and 0 <= cut < len(page) - 1:
+            page = page[cut + 1:]
+        return page, size - len(page), size, size
+    
+    @staticmethod
+    def ready_marker(bot_id: int) -> Optional[str]:
+        output = OutputMux.outputs.get(bot_id)
+        return output.ready_marker if output else None
+    
+    @staticmethod
+    def last_traceback(bot_id: int) -> Optional[str]:
+        output = OutputMux.outputs.get(bot_id)
+        return output.last_traceback if output else None
+    
+    @staticmethod
+    async def discard(bot_id: int):
+        await OutputMux.unfollow(bot_id)
+        OutputMux.outputs.pop(bot_id, None)
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🚀 ADVANCED BOT PROCESS MANAGER
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class AdoptedProcess:
+    """
+    A hosted bot that survived a controller restart (no longer our child)
+    and still writes straight to its log file. Mimics the asyncio Process
+    API that BotManager uses.
+    """
+
+    def __init__(self, proc: psutil.Process):
+        self._proc = proc
+        self.pid = proc.pid
+        self.returncode: Optional[int] = None
+
+    def _alive(self) -> bool:
+        try:
+            return self._proc.is_running() and self._proc.status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
+
+    def terminate(self):
+        try:
+            self._proc.terminate()
+        except psutil.NoSuchProcess:
+            pass
+
+    def kill(self):
+        try:
+            self._proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+    async def wait(self) -> Optional[int]:
+        """Poll until exit; the exit code of a non-child is unknown (None)"""
+        while self._alive():
+            await asyncio.sleep(config.ADOPT_POLL_INTERVAL)
+        return self.returncode
+
+class ForkedProcess:
+    """
+    A bot forked by the forkserver (a sibling, not our child).
+    Its exit code arrives over the spawn connection; mimics the asyncio
+    Process API that BotManager uses.
+    """
+
+    def __init__(self, pid: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self._reader = reader
+        self._writer = writer
+        # One reader for the exit message, however many coroutines wait()
+        self._exited = asyncio.ensure_future(self._watch())
+
+    async def _watch(self) -> Optional[int]:
+        try:
+            line = await self._reader.readline()
+            self.returncode = json.loads(line)["exit"]
+        except (ValueError, KeyError, OSError):
+            # Forkserver died: the bot was reparented, fall back to polling
+            try:
+                self.returncode = await AdoptedProcess(psutil.Process(self.pid)).wait()
+            except psutil.NoSuchProcess:
+                pass
+        finally:
+            self._writer.close()
+        return self.returncode
+
+    def terminate(self):
+        os.kill(self.pid, signal.SIGTERM)
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+
+    async def wait(self) -> Optional[int]:
+        return await asyncio.shield(self._exited)
+
+class ForkServer:
+    """
+    Controller side of forkserver.py: a pre-warmed interpreter with
+    FORKSERVER_PRELOAD imported, started on first use. Each spawn hands
+    it the bot's path, cwd and output fd and gets back a forked PID.
+    """
+    SCRIPT = os.path.join(config.BASE_DIR, "forkserver.py")
+    process: Optional[asyncio.subprocess.Process] = None
+    socket_path: Optional[str] = None
+    _lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    async def ensure():
+        """Start the forkserver if it isn't running"""
+        if ForkServer._lock is None:
+            ForkServer._lock = asyncio.Lock()
+        async with ForkServer._lock:
+            if ForkServer.process and ForkServer.process.returncode is None:
+                return
+            await ForkServer.stop()
+            
+            ForkServer.socket_path = os.path.join(tempfile.mkdtemp(prefix="gadget_fs_"), "fork.sock")
+            ForkServer.process = await asyncio.create_subprocess_exec(
+                sys.executable, ForkServer.SCRIPT, ForkServer.socket_path, *config.FORKSERVER_PRELOAD,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                cwd=config.BASE_DIR
+            )
+            try:
+                line = await asyncio.wait_for(
+                    ForkServer.process.stdout.readline(), config.FORKSERVER_START_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                line = b""
+            if line.strip() != b"READY":
+                await ForkServer.stop()
+                raise RuntimeError("forkserver failed to start")
+            logger.info(f"🍴 Forkserver ready (PID: {ForkServer.process.pid})")
+
+    @staticmethod
+    async def spawn(file_path: str, output_fd: int, limits: Optional[Dict] = None) -> ForkedProcess:
+        """
+        Fork a bot from the pre-warmed interpreter, writing stdout/stderr to
+        output_fd; the child applies limits (ResourceLimiter.prepare) itself.
+        """
+        await ForkServer.ensure()
+        
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(ForkServer.socket_path)
+            request = {"file_path": file_path, "cwd": os.path.dirname(file_path), "limits": limits}
+            socket.send_fds(sock, [json.dumps(request).encode()], [output_fd])
+            sock.setblocking(False)
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+        except OSError:
+            sock.close()
+            raise
+        
+        try:
+            reply = await asyncio.wait_for(reader.readline(), config.FORKSERVER_START_TIMEOUT)
+            pid = json.loads(reply)["pid"]
+        except (asyncio.TimeoutError, ValueError, KeyError):
+            writer.close()
+            raise RuntimeError("forkserver did not return a PID")
+        return ForkedProcess(pid, reader, writer)
+
+    @staticmethod
+    def is_forked(proc: psutil.Process, file_path: str, last_start: Optional[str]) -> bool:
+        """
+        Whether proc is a forkserver child running file_path. Forked bots
+        keep the server's cmdline, and uploaded bots share their user's
+        cwd, so also require that proc was created when the bot was
+        recorded as started (last_start, a Database.now() UTC string).
+        """
+        if not last_start:
+            return False
+        try:
+            if ForkServer.SCRIPT not in proc.cmdline() or proc.cwd() != os.path.dirname(file_path):
+                return False
+            started = datetime.strptime(last_start, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            return abs(started.timestamp() - proc.create_time()) <= config.FORKSERVER_START_TOLERANCE
+        except (psutil.Error, ValueError):
+            return False
+
+    @staticmethod
+    async def stop():
+        """Shut the forkserver down; bots it forked keep running until stopped"""
+        process, ForkServer.process = ForkServer.process, None
+        if process and process.returncode is None:
+            process.stdin.close()
+            try:
+                await asyncio.wait_for(process.wait(), config.STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        if ForkServer.socket_path:
+            shutil.rmtree(os.path.dirname(ForkServer.socket_path), ignore_errors=True)
+            ForkServer.socket_path = None
+
+class WorkerBot:
+    """
+    A bot hosted as a task inside a shared worker. pid is the worker's.
+    terminate() asks the worker to cancel the bot; kill() abandons it
+    (the worker drops it without waiting). A task can ignore cancellation,
+    so if the worker doesn't report the bot's exit within WORKER_KILL_GRACE
+    the whole worker is recycled. Mimics the asyncio Process API that
+    BotManager uses.
+    """
+
+    def __init__(self, pid: int, worker: "WorkerHandle", bot_id: int,
+                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.pid = pid
+        self.worker = worker
+        self.bot_id = bot_id
+        self.returncode: Optional[int] = None
+        self._reader = reader
+        self._writer = writer
+        self._exited = asyncio.ensure_future(self._watch())
+
+    async def _watch(self) -> Optional[int]:
+        try:
+            line = await self._reader.readline()
+            self.returncode = json.loads(line)["exit"]
+        except (ValueError, KeyError, OSError):
+            # Abandoned, or the worker itself died
+            worker_code = self.worker.process.returncode
+            self.returncode = worker_code if worker_code else -signal.SIGKILL
+        finally:
+            self._writer.close()
+            self.worker.bots.discard(self.bot_id)
+        return self.returncode
+
+    def terminate(self):
+        if not self._writer.is_closing():
+            self._writer.write(b"stop\n")
+
+    def kill(self):
+        if self._writer.is_closing():
+            return
+        self._writer.write(b"kill\n")
+        asyncio.get_running_loop().call_later(config.WORKER_KILL_GRACE, self._check_killed)
+    
+    def _check_killed(self):
+        if not self._exited.done():
+            asyncio.create_task(WorkerPool.recycle(
+                self.worker, f"bot {self.bot_id} ignored kill for {config.WORKER_KILL_GRACE}s"
+            ))
+
+    async def wait(self) -> Optional[int]:
+        return await asyncio.shield(self._exited)
+
+class WorkerHandle:
+    """One shared worker interpreter"""
+    __slots__ = ("process", "socket_path", "bots", "monitor")
+
+    def __init__(self, process: asyncio.subprocess.Process, socket_path: str):
+        self.process = process
+        self.socket_path = socket_path
+        self.bots: set = set()
+        self.monitor: Optional[asyncio.Task] = None  # Heartbeat watch (WorkerPool._monitor)
+
+class WorkerPool:
+    """
+    Controller side of worker.py: up to WORKER_POOL_SIZE shared
+    interpreters, each hosting up to WORKER_MAX_BOTS light aiogram bots.
+    A bot goes to the least loaded worker; a new worker is started only
+    when all are full. The workers exit with the controller, so their bots
+    are relaunched (not re-adopted) by the next reconcile.
+    
+    A worker whose event loop stops beating for WORKER_STALL_TIMEOUT, or
+    that can't drop a killed bot, is recycled: taken out of the pool and
+    killed. Its other bots' supervisors see them crash and restart them
+    per their restart policy (in another worker).
+    """
+    SCRIPT = os.path.join(config.BASE_DIR, "worker.py")
+    workers: List[WorkerHandle] = []
+    _lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    async def _start() -> WorkerHandle:
+        socket_path = os.path.join(tempfile.mkdtemp(prefix="gadget_wk_"), "worker.sock")
+        # The worker's limits cover all of its bots
+        limits_id = f"worker_{os.path.basename(os.path.dirname(socket_path))}"
+        process = await asyncio.create_subprocess_exec(
+            *ResourceLimiter.command(
+                [sys.executable, WorkerPool.SCRIPT, socket_path, *config.WORKER_PRELOAD], limits_id, "worker"
+            ),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=config.BASE_DIR
+        )
+        worker = WorkerHandle(process, socket_path)
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), config.FORKSERVER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            line = b""
+        if line.strip() != b"READY":
+            await WorkerPool._stop_worker(worker)
+            raise RuntimeError("worker failed to start")
+        
+        worker.monitor = asyncio.create_task(WorkerPool._monitor(worker))
+        logger.info(f"🏘️ Worker ready (PID: {process.pid})")
+        return worker
+
+    @staticmethod
+    async def _monitor(worker: WorkerHandle):
+        """Read the worker's heartbeats; a gap means one bot is blocking the shared loop"""
+        while True:
+            try:
+                line = await asyncio.wait_for(worker.process.stdout.readline(), config.WORKER_STALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                asyncio.create_task(WorkerPool.recycle(
+                    worker, f"event loop stalled for {config.WORKER_STALL_TIMEOUT}s"
+                ))
+                return
+            if not line:
+                return  # Worker exited
+
+    @staticmethod
+    async def recycle(worker: WorkerHandle, reason: str):
+        """Take a wedged worker out of the pool and kill it"""
+        if worker not in WorkerPool.workers:
+            return  # Already recycled or stopped
+        WorkerPool.workers.remove(worker)
+        logger.warning(f"♻️ Recycling worker {worker.process.pid} with {len(worker.bots)} bot(s): {reason}")
+        if worker.process.returncode is None:
+            worker.process.kill()
+        await WorkerPool._stop_worker(worker)
+
+    @staticmethod
+    async def _pick(bot_id: int) -> WorkerHandle:
+        """Least loaded live worker with room (starting one if needed); reserves the bot's slot"""
+        if WorkerPool._lock is None:
+            WorkerPool._lock = asyncio.Lock()
+        async with WorkerPool._lock:
+            for worker in [w for w in WorkerPool.workers if w.process.returncode is not None]:
+                WorkerPool.workers.remove(worker)
+                await WorkerPool._stop_worker(worker)
+            
+            open_workers = [w for w in WorkerPool.workers if len(w.bots) < config.WORKER_MAX_BOTS]
+            if open_workers:
+                worker = min(open_workers, key=lambda w: len(w.bots))
+            elif len(WorkerPool.workers) >= config.WORKER_POOL_SIZE:
+                raise RuntimeError("worker pool is full")
+            else:
+                worker = await WorkerPool._start()
+                WorkerPool.workers.append(worker)
+            worker.bots.add(bot_id)
+            return worker
+
+    @staticmethod
+    def compatible(file_path: str, python: str, tier: str) -> Tuple[bool, str]:
+        """Whether this bot may share a worker (blocking: parses the file)"""
+        if tier not in config.WORKER_TIERS:
+            return False, f"{tier} tier"
+        # Workers only have the controller's packages
+        if python != sys.executable:
+            return False, "own virtualenv"
+        entry, reason = inspect_bot(file_path)
+        return entry is not None, reason
+
+    @staticmethod
+    async def spawn(bot_id: int, file_path: str, output_fd: int) -> WorkerBot:
+        """Host a bot in a shared worker, writing its stdout/stderr to output_fd"""
+        worker = await WorkerPool._pick(bot_id)
+        
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(worker.socket_path)
+            request = {"bot_id": bot_id, "file_path": file_path}
+            socket.send_fds(sock, [json.dumps(request).encode()], [output_fd])
+            sock.setblocking(False)
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+        except OSError:
+            sock.close()
+            worker.bots.discard(bot_id)
+            raise
+        
+        try:
+            reply = await asyncio.wait_for(reader.readline(), config.FORKSERVER_START_TIMEOUT)
+            pid = json.loads(reply)["pid"]
+        except (asyncio.TimeoutError, ValueError, KeyError):
+            writer.close()
+            worker.bots.discard(bot_id)
+            raise RuntimeError("worker did not accept the bot")
+        return WorkerBot(pid, worker, bot_id, reader, writer)
+
+    @staticmethod
+    async def _stop_worker(worker: WorkerHandle):
+        if worker.monitor is not None and worker.monitor is not asyncio.current_task():
+            worker.monitor.cancel()
+        process = worker.process
+        if process.returncode is None:
+            process.stdin.close()
+            try:
+                await asyncio.wait_for(process.wait(), config.STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        shutil.rmtree(os.path.dirname(worker.socket_path), ignore_errors=True)
+
+    @staticmethod
+    async def stop():
+        """Shut every worker down (their bots end with them)"""
+        workers, WorkerPool.workers = WorkerPool.workers, []
+        await asyncio.gather(*(WorkerPool._stop_worker(w) for w in workers))
+
+class BotManager:
+    running_processes: Dict[int, asyncio.subprocess.Process] = {}
+    # One watcher task per started bot: waits for exit, applies restart policy
+    supervisors: Dict[int, asyncio.Task] = {}
+    # Recent crash times per bot (monotonic), for backoff + crash-loop detection
+    crash_history: Dict[int, deque] = {}
+    
+    RESTART_POLICIES = ("on-failure", "always", "never")
+    
+    @staticmethod
+    async def start_bot(bot_id: int, file_path: str, db: AsyncDatabase, python: str = sys.executable) -> Tuple[bool, str]:
+        """Start a hosted bot with monitoring (python comes from StartScheduler's venv build)"""
+        # A pending auto-restart must not race a manual start
+        BotManager._cancel_supervisor(bot_id)
+        try:
+            record = await db.get_bot(bot_id)
+            user = await db.get_user(record.user_id) if record else None
+            tier = "premium" if user and user['is_premium'] else "free"
+            
+            shared = False
+            if config.LAUNCH_MODE == "worker":
+                shared, reason = await asyncio.to_thread(WorkerPool.compatible, file_path, python, tier)
+                if not shared:
+                    logger.info(f"🏘️ Bot {bot_id} gets its own process: {reason}")
+            
+            await OutputMux.host_notice(bot_id, "▶️ Starting")
+            # stdout+stderr go straight into the log file, followed by OutputMux;
+            # the child gets its own copy of the fd, ours is closed right after spawn
+            output_fd = await OutputMux.attach(bot_id)
+            try:
+                process = None
+                # The forkserver only has the controller's packages
+                if config.LAUNCH_MODE == "forkserver" and python == sys.executable:
+                    try:
+                        process = await ForkServer.spawn(
+                            file_path, output_fd, ResourceLimiter.prepare(bot_id, tier)
+                        )
+                    except (OSError, RuntimeError) as e:
+                        logger.warning(f"🍴 Forkserver launch of bot {bot_id} failed ({e}), using exec")
+                if shared:
+                    try:
+                        process = await WorkerPool.spawn(bot_id, file_path, output_fd)
+                    except (OSError, RuntimeError) as e:
+                        logger.warning(f"🏘️ Worker launch of bot {bot_id} failed ({e}), using exec")
+                if process is None:
+                    process = await asyncio.create_subprocess_exec(
+                        *ResourceLimiter.command([python, file_path], bot_id, tier),
+                        stdout=output_fd,
+                        stderr=subprocess.STDOUT,
+                        cwd=os.path.dirname(file_path)
+                    )
+            finally:
+                os.close(output_fd)
+            
+            BotManager.running_processes[bot_id] = process
+            BotManager.supervisors[bot_id] = asyncio.create_task(
+                BotManager._supervise(bot_id, file_path, process, db)
+            )
+            
+            # Update database
+            await db.mark_bot_running(bot_id, process.pid)
+            
+            where = " (shared worker)" if isinstance(process, WorkerBot) else ""
+            logger.info(f"🚀 Bot {bot_id} started (PID: {process.pid}){where}")
+            return True, f"✅ <b>Bot Started!</b>\n\n🆔 Process ID: <code>{process.pid}</code>{where}"
+        
+        except Exception as e:
+            logger.error(f"❌ Failed to start bot {bot_id}: {e}")
+            return False, f"❌ <b>Failed to start:</b>\n<pre>{str(e)}</pre>"
+    
+    @staticmethod
+    async def stop_bot(bot_id: int, db: AsyncDatabase) -> Tuple[bool, str]:
+        """Stop a running bot"""
+        try:
+            await BotManager.stop_bots([bot_id], db)
+            
+            logger.info(f"⏹ Bot {bot_id} stopped")
+            return True, "✅ Bot stopped successfully!"
+        
+        except Exception as e:
+            logger.error(f"❌ Failed to stop bot {bot_id}: {e}")
+            return False, f"❌ <b>Stop failed:</b>\n<pre>{str(e)}</pre>"
+    
+    @staticmethod
+    async def stop_bots(bot_ids: List[int], db: AsyncDatabase) -> int:
+        """
+        Stop many bots at once: SIGTERM to all, one shared deadline,
+        SIGKILL for stragglers, one DB transaction.
+        Returns how many had a live process.
+        """
+        # Queued starts are dropped; one being spawned is let finish, then stopped below
+        await asyncio.gather(*(StartScheduler.cancel(bot_id) for bot_id in bot_ids))
+        
+        processes = {}
+        descendants: List[psutil.Process] = []
+        for bot_id in bot_ids:
+            BotManager._cancel_supervisor(bot_id)
+            BotManager.crash_history.pop(bot_id, None)
+            process = BotManager.running_processes.get(bot_id)
+            if process is not None:
+                processes[bot_id] = process
+                if isinstance(process, WorkerBot):
+                    continue  # The worker's children aren't this bot's
+                # Snapshot now: once the parent dies its children get reparented
+                try:
+                    descendants.extend(psutil.Process(process.pid).children(recursive=True))
+                except psutil.Error:
+                    pass
+        
+        for process in processes.values():
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass
+        
+        deadline = time.monotonic() + config.STOP_TIMEOUT
+        waiters = {bot_id: asyncio.ensure_future(p.wait()) for bot_id, p in processes.items()}
+        if waiters:
+            _, pending = await asyncio.wait(waiters.values(), timeout=config.STOP_TIMEOUT)
+            if pending:
+                for bot_id, waiter in waiters.items():
+                    if waiter in pending:
+                        try:
+                            processes[bot_id].kill()
+                        except ProcessLookupError:
+                            pass
+                await asyncio.wait(pending)
+        
+        # Leftover children would keep ports/files busy for the next start
+        if descendants:
+            await asyncio.to_thread(BotManager._reap_descendants, descendants, deadline)
+        
+        for bot_id, process in processes.items():
+            if BotManager.running_processes.get(bot_id) is process:
+                del BotManager.running_processes[bot_id]
+        # Their supervisors were cancelled: read the last output and stop following here
+        await asyncio.gather(*(OutputMux.drain(bot_id) for bot_id in processes))
+        
+        # Update database
+        await db.mark_bots_stopped(list(bot_ids))
+        return len(processes)
+    
+    @staticmethod
+    def _find_live_process(pid: Optional[int], file_path: str, last_start: Optional[str]) -> Optional[psutil.Process]:
+        """The recorded PID if it is still our bot (guards against PID reuse)"""
+        if not pid:
+            return None
+        try:
+            proc = psutil.Process(pid)
+            if proc.status() == psutil.STATUS_ZOMBIE:
+                return None
+            if file_path not in proc.cmdline() and not ForkServer.is_forked(proc, file_path, last_start):
+                return None
+            return proc
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+    
+    @staticmethod
+    def _logs_directly(proc: psutil.Process, bot_id: int) -> bool:
+        """Whether proc's stdout is the bot's log file rather than a (now unread) controller pipe"""
+        try:
+            return os.readlink(f"/proc/{proc.pid}/fd/1") == os.path.realpath(LogStore.path(bot_id))
+        except OSError:
+            return False
+    
+    @staticmethod
+    async def reconcile(db: AsyncDatabase) -> Tuple[int, int]:
+        """
+        Boot-time recovery for bots recorded as 'running'.
+        Live PIDs that write straight to their log file (every bot started
+        by this controller) are re-adopted under a supervisor, and OutputMux
+        follows their file again. Live bots whose output went into an older
+        controller's pipe are stopped: nobody reads that pipe any more, and
+        Python ignores SIGPIPE, so they would run on with their output lost.
+        Those and the dead ones are marked stopped in one transaction, then
+        relaunched through a bounded queue.
+        Returns (adopted, relaunched).
+        """
+        recorded = [r for r in db.bots.all() if r.status == "running"]
+        adopted, dead, orphans = 0, [], []
+        
+        for record in recorded:
+            if record.id in BotManager.running_processes:
+                continue
+            proc = BotManager._find_live_process(record.process_id, record.file_path, record.last_start)
+            if proc and BotManager._logs_directly(proc, record.id):
+                process = AdoptedProcess(proc)
+                await OutputMux.follow(record.id)
+                BotManager.running_processes[record.id] = process
+                BotManager.supervisors[record.id] = asyncio.create_task(
+                    BotManager._supervise(record.id, record.file_path, process, db)
+                )
+                adopted += 1
+            else:
+                if proc:
+                    orphans.append(proc)
+                dead.append(record)
+        
+        if orphans:
+            procs = list(orphans)
+            for proc in orphans:
+                try:
+                    procs.extend(proc.children(recursive=True))
+                except psutil.Error:
+                    pass
+            await asyncio.to_thread(
+                BotManager._reap_descendants, procs, time.monotonic() + config.STOP_TIMEOUT
+            )
+            logger.info(f"♻️ Stopped {len(orphans)} bot(s) left writing to an old controller's pipe")
+        
+        await db.mark_bots_stopped([r.id for r in dead])
+        
+        # The start scheduler paces the relaunch storm (premium bots first)
+        futures = [await StartScheduler.submit(r.id, r.file_path, db) for r in dead]
+        results = await asyncio.gather(*futures)
+        relaunched = sum(success for success, _ in results)
+        
+        logger.info(
+            f"♻️ Reconciled {len(recorded)} bot(s): {adopted} re-adopted, "
+            f"{relaunched}/{len(dead)} relaunched"
+        )
+        return adopted, relaunched
+    
+    @staticmethod
+    def _cancel_supervisor(bot_id: int):
+        """Detach the watcher so an intentional stop/start isn't seen as a crash"""
+        task = BotManager.supervisors.pop(bot_id, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+    
+    @staticmethod
+    async def _supervise(bot_id: int, file_path: str, process: asyncio.subprocess.Process, db: AsyncDatabase):
+        """Wait for the process to exit, record it and apply the restart policy"""
+        started = time.monotonic()
+        exit_code = await process.wait()
+        # Let the last output (e.g. the final traceback) be read before judging the exit
+        await OutputMux.drain(bot_id)
+        
+        if BotManager.running_processes.get(bot_id) is process:
+            del BotManager.running_processes[bot_id]
+        
+        record = await db.get_bot(bot_id)
+        if record is None:
+            return  # Deleted meanwhile
+        policy = record.restart_policy or config.DEFAULT_RESTART_POLICY
+        
+        # A long healthy run forgives earlier crashes
+        history = BotManager.crash_history.setdefault(bot_id, deque())
+        now = time.monotonic()
+        if now - started >= config.RESTART_RESET_AFTER:
+            history.clear()
+        history.append(now)
+        while history and now - history[0] > config.CRASH_LOOP_WINDOW:
+            history.popleft()
+        
+        should_restart = policy == "always" or (policy == "on-failure" and exit_code != 0)
+        
+        if should_restart and len(history) >= config.CRASH_LOOP_THRESHOLD:
+            await db.mark_bot_exited(bot_id, exit_code, "crashloop")
+            BotManager.supervisors.pop(bot_id, None)
+            logger.error(
+                f"💥 Bot {bot_id} crash loop: {len(history)} exits in "
+                f"{config.CRASH_LOOP_WINDOW}s (last code {exit_code}) - auto-restart disabled"
+            )
+            return
+        
+        violation = ResourceLimiter.describe_violation(bot_id, exit_code)
+        if violation:
+            await OutputMux.host_notice(bot_id, f"⛔ Stopped by host: {violation}")
+            status = "limited"
+        else:
+            status = "crashed" if exit_code != 0 else "exited"
+        
+        await db.mark_bot_exited(bot_id, exit_code, status)
+        logger.warning(f"💥 Bot {bot_id} exited with code {exit_code} (policy: {policy}){f' - {violation}' if violation else ''}")
+        
+        if not should_restart:
+            BotManager.supervisors.pop(bot_id, None)
+            return
+        
+        delay = min(
+            config.RESTART_BACKOFF_BASE * (2 ** (len(history) - 1)),
+            config.RESTART_BACKOFF_MAX
+        )
+        logger.info(f"🔄 Restarting bot {bot_id} in {delay:.0f}s (attempt {len(history)})")
+        await asyncio.sleep(delay)
+        
+        if BotManager.supervisors.get(bot_id) is asyncio.current_task():
+            await StartScheduler.submit(bot_id, file_path, db)
+    
+    @staticmethod
+    def _reap_descendants(procs: List[psutil.Process], deadline: float):
+        """SIGTERM surviving child processes, SIGKILL them at the deadline (blocking)"""
+        def gone(proc: psutil.Process) -> bool:
+            # Orphans are reaped by init, so a zombie already counts as exited
+            try:
+                return proc.status() == psutil.STATUS_ZOMBIE
+            except psutil.Error:
+                return True
+        
+        alive = []
+        for proc in procs:
+            try:
+                proc.terminate()
+                alive.append(proc)
+            except psutil.Error:
+                pass
+        
+        def wait_gone(procs: List[psutil.Process], until: float) -> List[psutil.Process]:
+            while procs and time.monotonic() < until:
+                procs = [p for p in procs if not gone(p)]
+                if procs:
+                    time.sleep(0.05)
+            return procs
+        
+        alive = wait_gone(alive, deadline)
+        for proc in alive:
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+        wait_gone(alive, time.monotonic() + 1)
+    
+    @staticmethod
+    async def wait_ready(bot_id: int, grace: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        Wait until a just-started bot is ready: it printed a READY_MARKERS
+        line (seen by OutputMux), or it is still alive after the grace window.
+        Fails as soon as the process exits.
+        """
+        grace = config.READY_GRACE if grace is None else grace
+        process = BotManager.running_processes.get(bot_id)
+        if process is None:
+            return False, "process not running"
+        
+        deadline = time.monotonic() + grace
+        
+        while True:
+            if process.returncode is not None or BotManager.running_processes.get(bot_id) is not process:
+                return False, f"exited with code {process.returncode}"
+            
+            marker = OutputMux.ready_marker(bot_id)
+            if marker:
+                return True, f"marker '{marker}'"
+            
+            if time.monotonic() >= deadline:
+                return True, f"alive after {grace:g}s"
+            await asyncio.sleep(config.READY_POLL_INTERVAL)
+    
+    @staticmethod
+    async def restart_bot(bot_id: int, file_path: str, db: AsyncDatabase) -> Tuple[bool, str]:
+        """Restart a bot: stop (waits for real exit), start via StartScheduler, then wait for readiness"""
+        started = time.monotonic()
+        await BotManager.stop_bot(bot_id, db)
+        
+        future = await StartScheduler.submit(bot_id, file_path, db)
+        success, msg = await future
+        if not success:
+            return success, msg
+        
+        # The scheduler already waited up to START_SETTLE_TIME of the grace
+        ready, detail = await BotManager.wait_ready(
+            bot_id, grace=max(0.0, config.READY_GRACE - config.START_SETTLE_TIME)
+        )
+        elapsed = time.monotonic() - started
+        if not ready:
+            return False, f"{config.EMOJI['warning']} <b>Restarted but not healthy!</b>\n\n💥 Process {detail} - check the logs."
+        
+        pid = BotManager.running_processes[bot_id].pid
+        return True, (
+            f"✅ <b>Bot Restarted!</b>\n\n🆔 Process ID: <code>{pid}</code>\n"
+            f"⚡ Ready in {elapsed:.1f}s ({detail})"
+        )
+    
+    @staticmethod
+    async def get_bot_logs(bot_id: int, lines: int = 50) -> str:
+        """Retrieve the last lines of a bot's log (from memory, else read from the end off the event loop)"""
+        text = OutputMux.tail(bot_id, lines)
+        if text is not None:
+            return text if text else "📜 Log file is empty."
+        
+        try:
+            text = await asyncio.to_thread(LogStore.tail, bot_id, lines)
+        except Exception as e:
+            return f"❌ Error reading logs: {e}"
+        
+        if text is None:
+            return "📜 No logs available yet."
+        return text if text else "📜 Log file is empty."
+    
+    @staticmethod
+    async def delete_bot(bot_id: int, db: AsyncDatabase) -> Tuple[bool, str]:
+        """Delete bot and clean up files"""
+        try:
+            await BotManager.stop_bot(bot_id, db)
+            
+            file_path = await db.get_bot_file_path(bot_id)
+            
+            if file_path:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                
+                # Clean up directory if empty
+                dir_path = os.path.dirname(file_path)
+                if os.path.exists(dir_path) and not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+                
+                # Delete log file and its rotated segments
+                await OutputMux.discard(bot_id)
+                LogStore.delete(bot_id)
+            
+            await db.delete_bot(bot_id)
+            MetricsSampler.history.pop(bot_id, None)
+            
+            logger.info(f"🗑 Bot {bot_id} deleted")
+            return True, "✅ Bot deleted successfully!"
+        
+        except Exception as e:
+            logger.error(f"❌ Delete failed: {e}")
+            return False, f"❌ <b>Delete failed:</b>\n<pre>{str(e)}</pre>"
+    
+    @staticmethod
+    async def kill_user_bots(user_id: int, db: AsyncDatabase) -> int:
+        """Kill all bots for a user"""
+        bots = await db.get_user_bots(user_id)
+        # Also catch crashed bots waiting on an auto-restart or a start slot
+        targets = [
+            b['id'] for b in bots
+            if b['status'] == 'running' or b['id'] in BotManager.supervisors
+            or b['id'] in StartScheduler.pending
+        ]
+        return await BotManager.stop_bots(targets, db)
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🚦 START SCHEDULER - Admission Control & Priority Lanes
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class StartRequest:
+    """A bot waiting for a start slot"""
+    __slots__ = ("bot_id", "file_path", "db", "lane", "future", "queued_at", "python", "prepare", "spawn", "cancelled")
+    
+    def __init__(self, bot_id: int, file_path: str, db: AsyncDatabase, lane: str):
+        self.bot_id = bot_id
+        self.file_path = file_path
+        self.db = db
+        self.lane = lane
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.monotonic()
+        self.python: Optional[str] = None  # Interpreter, once its venv is built
+        self.prepare: Optional[asyncio.Task] = None  # The venv build, before queueing
+        self.spawn: Optional[asyncio.Task] = None  # start_bot, once admitted
+        self.cancelled = False
+
+class StartScheduler:
+    """
+    Every bot start goes through here: at most MAX_CONCURRENT_STARTS
+    interpreters boot at once, and none while the host is under load
+    or short on memory. Premium starts are served first. A git bot's
+    venv is built before it queues, so a long pip install never holds
+    a slot (and a stop can cancel it).
+    """
+    lanes: Dict[str, deque] = {"premium": deque(), "free": deque()}
+    pending: Dict[int, StartRequest] = {}
+    in_flight = 0
+    # Premium starts admitted since the free lane was last served
+    premium_streak = 0
+    _retry_handle: Optional[asyncio.TimerHandle] = None
+    
+    @staticmethod
+    async def submit(bot_id: int, file_path: str, db: AsyncDatabase) -> asyncio.Future:
+        """Queue a start; the future resolves to start_bot's (success, message)"""
+        request = StartScheduler.pending.get(bot_id)
+        if request:
+            return request.future
+        
+        record = await db.get_bot(bot_id)
+        user = await db.get_user(record.user_id) if record else None
+        lane = "premium" if user and user['is_premium'] else "free"
+        
+        request = StartRequest(bot_id, file_path, db, lane)
+        StartScheduler.pending[bot_id] = request
+        request.prepare = asyncio.create_task(StartScheduler._prepare(request))
+        return request.future
+    
+    @staticmethod
+    async def _prepare(request: StartRequest):
+        """Build the bot's venv (outside the slots), then queue it"""
+        try:
+            # Git bots with a requirements.txt get their own (cached) venv
+            success, python = await EnvCache.python_for(request.file_path)
+        except Exception as e:
+            success, python = False, str(e)
+        if not success:
+            logger.error(f"❌ Bot {request.bot_id} environment failed: {python}")
+            StartScheduler._finish(
+                request, (False, f"❌ <b>Dependency install failed:</b>\n<pre>{html.escape(python[-1000:])}</pre>")
+            )
+            return
+        if StartScheduler.pending.get(request.bot_id) is not request:
+            return  # Cancelled while building
+        request.python = python
+        request.queued_at = time.monotonic()
+        StartScheduler.lanes[request.lane].append(request)
+        StartScheduler._pump()
+    
+    @staticmethod
+    def position(bot_id: int) -> Optional[int]:
+        """1-based place in the queue, None once admitted (or not queued)"""
+        request = StartScheduler.pending.get(bot_id)
+        if request is None:
+            return None
+        premium, free = StartScheduler.lanes["premium"], StartScheduler.lanes["free"]
+        if request.lane == "premium":
+            return premium.index(request) + 1 if request in premium else None
+        return len(premium) + free.index(request) + 1 if request in free else None
+    
+    @staticmethod
+    async def cancel(bot_id: int) -> bool:
+        """
+        Drop a queued start. An admitted one is marked cancelled and, if it
+        is spawning, awaited, so the caller can then stop its process.
+        """
+        request = StartScheduler.pending.get(bot_id)
+        if request is None:
+            return False
+        if not request.prepare.done():
+            request.prepare.cancel()  # Kills a running pip
+            StartScheduler._finish(request, (False, "⏹ Start cancelled."))
+            return True
+        if request in StartScheduler.lanes[request.lane]:
+            StartScheduler.lanes[request.lane].remove(request)
+            StartScheduler._finish(request, (False, "⏹ Queued start cancelled."))
+            return True
+        
+        request.cancelled = True
+        StartScheduler._finish(request, (False, "⏹ Start cancelled."))
+        if request.spawn is not None:
+            await asyncio.wait({request.spawn})
+        return True
+    
+    @staticmethod
+    def host_pressure() -> Optional[str]:
+        """Why the host can't take another interpreter right now, or None"""
+        load = psutil.getloadavg()[0] / (psutil.cpu_count() or 1)
+        if load > config.ADMISSION_MAX_LOAD:
+            return f"CPU load {load:.2f}/core"
+        available_mb = psutil.virtual_memory().available / (1024 * 1024)
+        if available_mb < config.ADMISSION_MIN_FREE_MB:
+            return f"{available_mb:.0f} MB RAM free"
+        return None
+    
+    @staticmethod
+    def _next() -> Optional[StartRequest]:
+        """Premium first, but every PREMIUM_LANE_WEIGHT premium starts let one free start through"""
+        premium, free = StartScheduler.lanes["premium"], StartScheduler.lanes["free"]
+        if premium and (not free or StartScheduler.premium_streak < config.PREMIUM_LANE_WEIGHT):
+            StartScheduler.premium_streak += 1
+            return premium.popleft()
+        if free:
+            StartScheduler.premium_streak = 0
+            return free.popleft()
+        return None
+    
+    @staticmethod
+    def _pump():
+        """Admit queued starts while there is a free slot and the host has headroom"""
+        StartScheduler._expire()
+        while StartScheduler.in_flight < config.MAX_CONCURRENT_STARTS and any(StartScheduler.lanes.values()):
+            pressure = StartScheduler.host_pressure()
+            if pressure:
+                # A finishing start may never come to wake us, so poll for headroom
+                if StartScheduler._retry_handle is None:
+                    logger.info(f"🚦 Start admission paused: {pressure}")
+                    StartScheduler._retry_handle = asyncio.get_running_loop().call_later(
+                        config.ADMISSION_RETRY_INTERVAL, StartScheduler._retry
+                    )
+                return
+            request = StartScheduler._next()
+            StartScheduler.in_flight += 1
+            asyncio.create_task(StartScheduler._run(request))
+    
+    @staticmethod
+    def _retry():
+        StartScheduler._retry_handle = None
+        StartScheduler._pump()
+    
+    @staticmethod
+    def _expire():
+        """Fail starts that waited longer than START_QUEUE_TIMEOUT"""
+        cutoff = time.monotonic() - config.START_QUEUE_TIMEOUT
+        for lane in StartScheduler.lanes.values():
+            while lane and lane[0].queued_at < cutoff:
+                StartScheduler._finish(
+                    lane.popleft(),
+                    (False, "❌ <b>Host is busy</b> - start timed out in the queue, try again later.")
+                )
+    
+    @staticmethod
+    async def _run(request: StartRequest):
+        """Start the bot and hold its slot until it is up (or START_SETTLE_TIME passes)"""
+        result = (False, "❌ <b>Failed to start</b>")
+        try:
+            if request.cancelled:
+                return  # Stopped between admission and here
+            request.spawn = asyncio.create_task(
+                BotManager.start_bot(request.bot_id, request.file_path, request.db, request.python)
+            )
+            result = await request.spawn
+            if result[0] and not request.cancelled:
+                await BotManager.wait_ready(request.bot_id, grace=config.START_SETTLE_TIME)
+        finally:
+            StartScheduler.in_flight -= 1
+            StartScheduler._finish(request, result)
+            StartScheduler._pump()
+    
+    @staticmethod
+    def _finish(request: StartRequest, result: Tuple[bool, str]):
+        if StartScheduler.pending.get(request.bot_id) is request:
+            del StartScheduler.pending[request.bot_id]
+        if not request.future.done():
+            request.future.set_result(result)
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 📈 PER-BOT METRICS SAMPLER
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class BotMetrics:
+    """Fixed-size ring buffers of one bot's samples (O(1) per sample)"""
+    __slots__ = ("cpu", "rss", "threads", "fds", "timestamps")
+
+    def __init__(self, size: int):
+        self.cpu = deque(maxlen=size)
+        self.rss = deque(maxlen=size)
+        self.threads = deque(maxlen=size)
+        self.fds = deque(maxlen=size)
+        self.timestamps = deque(maxlen=size)
+
+    def add(self, cpu: float, rss: int, threads: int, fds: int):
+        self.cpu.append(cpu)
+        self.rss.append(rss)
+        self.threads.append(threads)
+        self.fds.append(fds)
+        self.timestamps.append(time.time())
+
+class MetricsSampler:
+    """
+    Samples CPU%, RSS, threads and FDs of every running bot (children
+    included) in one batched psutil pass per METRICS_INTERVAL.
+    """
+    history: Dict[int, BotMetrics] = {}
+    # bot_id -> {pid: psutil.Process}; cpu_percent() needs the same object between samples
+    _procs: Dict[int, Dict[int, psutil.Process]] = {}
+    
+    SPARK_CHARS = "▁▂▃▄▅▆▇█"
+    
+    @staticmethod
+    def _sample_bot(bot_id: int, root_pid: int) -> Optional[Tuple[float, int, int, int]]:
+        cached = MetricsSampler._procs.get(bot_id, {})
+        try:
+            root = cached.get(root_pid) or psutil.Process(root_pid)
+            tree = [root] + root.children(recursive=True)
+        except psutil.Error:
+            MetricsSampler._procs.pop(bot_id, None)
+            return None
+        
+        procs = {}
+        cpu = 0.0
+        rss = threads = fds = 0
+        for proc in tree:
+            proc = cached.get(proc.pid, proc)
+            try:
+                with proc.oneshot():
+                    cpu += proc.cpu_percent(None)
+                    rss += proc.memory_info().rss
+                    threads += proc.num_threads()
+                    fds += proc.num_fds() if hasattr(proc, "num_fds") else proc.num_handles()
+                procs[proc.pid] = proc
+            except psutil.Error:
+                continue
+        MetricsSampler._procs[bot_id] = procs
+        return cpu, rss, threads, fds
+    
+    @staticmethod
+    def sample_all() -> int:
+        """One pass over running_processes (blocking psutil calls - run in a thread)"""
+        # A worker's usage can't be split per bot, so its bots aren't sampled
+        targets = {
+            bot_id: p.pid for bot_id, p in list(BotManager.running_processes.items())
+            if not isinstance(p, WorkerBot)
+        }
+        
+        for bot_id in list(MetricsSampler._procs):
+            if bot_id not in targets:
+                del MetricsSampler._procs[bot_id]
+        
+        for bot_id, pid in targets.items():
+            sample = MetricsSampler._sample_bot(bot_id, pid)
+            if sample is None:
+                continue
+            metrics = MetricsSampler.history.get(bot_id)
+            if metrics is None:
+                metrics = MetricsSampler.history[bot_id] = BotMetrics(config.METRICS_HISTORY)
+            metrics.add(*sample)
+        return len(targets)
+    
+    @staticmethod
+    async def run():
+        """Background loop"""
+        while True:
+            try:
+                await asyncio.to_thread(MetricsSampler.sample_all)
+            except Exception as e:
+                logger.error(f"Metrics sampler error: {e}")
+            await asyncio.sleep(config.METRICS_INTERVAL)
+    
+    @staticmethod
+    def sparkline(values, width: int = 24) -> str:
+        values = list(values)[-width:]
+        if not values:
+            return ""
+        low, high = min(values), max(values)
+        span = (high - low) or 1
+        top = len(MetricsSampler.SPARK_CHARS) - 1
+        return "".join(MetricsSampler.SPARK_CHARS[int((v - low) / span * top)] for v in values)
+    
+    @staticmethod
+    def render(bot_id: int) -> str:
+        """Stats panel text for one bot"""
+        process = BotManager.running_processes.get(bot_id)
+        if isinstance(process, WorkerBot):
+            return (
+                f"📊 <b>STATS - BOT #{bot_id}</b>\n\n<i>Runs in a shared worker (PID {process.pid}) "
+                f"with {len(process.worker.bots)} bot(s) - per-bot usage isn't measured.</i>"
+            )
+        metrics = MetricsSampler.history.get(bot_id)
+        if not metrics or not metrics.cpu:
+            return f"📊 <b>STATS - BOT #{bot_id}</b>\n\n<i>No samples yet - start the bot and check back in a minute.</i>"
+        
+        def summary(values, fmt) -> str:
+            values = list(values)
+            return f"min {fmt(min(values))} | avg {fmt(sum(values) / len(values))} | max {fmt(max(values))}"
+        
+        mb = lambda v: f"{v / (1024 * 1024):.1f}MB"
+        pct = lambda v: f"{v:.1f}%"
+        num = lambda v: f"{v:.0f}"
+        window = int(metrics.timestamps[-1] - metrics.timestamps[0]) if len(metrics.timestamps) > 1 else 0
+        
+        return f"""
+📊 <b>STATS - BOT #{bot_id}</b>
+
+⚙️ <b>CPU:</b> {pct(metrics.cpu[-1])}
+┣ {summary(metrics.cpu, pct)}
+┗ <code>{MetricsSampler.sparkline(metrics.cpu)}</code>
+
+💾 <b>RAM (RSS):</b> {mb(metrics.rss[-1])}
+┣ {summary(metrics.rss, mb)}
+┗ <code>{MetricsSampler.sparkline(metrics.rss)}</code>
+
+🧵 Threads: {metrics.threads[-1]} ({summary(metrics.threads, num)})
+📂 Open FDs: {metrics.fds[-1]} ({summary(metrics.fds, num)})
+
+🕐 {len(metrics.cpu)} samples over {window // 60}m {window % 60}s
+"""
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 📡 LIVE LOG FOLLOW
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class FollowViewer:
+    """One Telegram message showing a bot's live log"""
+    __slots__ = ("chat_id", "message_id", "offset", "started", "last_edit", "next_edit")
+    
+    def __init__(self, chat_id: int, message_id: int, offset: int):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.offset = offset  # Reader offset this viewer last displayed
+        self.started = time.monotonic()
+        self.last_edit = self.started
+        self.next_edit = 0.0  # Earliest next edit (throttle / RetryAfter)
+
+class LogFollower:
+    """
+    One reader task per followed bot polls only the bytes appended since
+    its last read and keeps a window of recent lines. Every viewer of that
+    bot renders from the shared window: its message is edited at most every
+    LOG_FOLLOW_EDIT_INTERVAL seconds, and only once the reader has moved past
+    the viewer's offset. A viewer stops after LOG_FOLLOW_IDLE seconds with no
+    new output, or after LOG_FOLLOW_MAX_DURATION.
+    """
+    viewers: Dict[int, Dict[Tuple[int, int], FollowViewer]] = {}
+    readers: Dict[int, asyncio.Task] = {}
+    windows: Dict[int, deque] = {}
+    offsets: Dict[int, int] = {}
+    partial: Dict[int, bytes] = {}
+    last_output: Dict[int, float] = {}
+    
+    @staticmethod
+    async def follow(bot_id: int, chat_id: int, message_id: int):
+        """Attach a message to the bot's live view (starting the reader if needed)"""
+        if bot_id not in LogFollower.readers:
+            def snapshot() -> Tuple[str, int]:
+                path = LogStore.path(bot_id)
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                return LogStore.tail(bot_id, config.LOG_FOLLOW_LINES) or "", size
+            
+            text, size = await asyncio.to_thread(snapshot)
+            # Another viewer may have started the reader meanwhile
+            if bot_id not in LogFollower.readers:
+                LogFollower.windows[bot_id] = deque(text.splitlines(), maxlen=config.LOG_FOLLOW_LINES)
+                LogFollower.offsets[bot_id] = size
+                LogFollower.partial[bot_id] = b""
+                LogFollower.last_output[bot_id] = time.monotonic()
+                LogFollower.viewers[bot_id] = {}
+                LogFollower.readers[bot_id] = asyncio.create_task(LogFollower._reader(bot_id))
+        
+        viewer = FollowViewer(chat_id, message_id, LogFollower.offsets[bot_id])
+        LogFollower.viewers[bot_id][(chat_id, message_id)] = viewer
+        await LogFollower._render(bot_id, viewer)
+    
+    @staticmethod
+    def unfollow(bot_id: int, chat_id: int, message_id: int) -> bool:
+        """Detach a message; the reader stops by itself once nobody watches"""
+        return LogFollower.viewers.get(bot_id, {}).pop((chat_id, message_id), None) is not None
+    
+    @staticmethod
+    def _read_new(bot_id: int) -> bytes:
+        """Bytes appended since the last poll (blocking)"""
+        path = LogStore.path(bot_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return b""
+        offset = LogFollower.offsets[bot_id]
+        if size < offset:
+            offset = 0  # Rotated (copytruncate)
+        # A burst bigger than what we can show: skip to its tail
+        offset = max(offset, size - config.LOG_FOLLOW_MAX_READ)
+        if size == offset:
+            return b""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        LogFollower.offsets[bot_id] = offset + len(data)
+        return data
+    
+    @staticmethod
+    async def _reader(bot_id: int):
+        try:
+            while LogFollower.viewers.get(bot_id):
+                await asyncio.sleep(config.LOG_FOLLOW_POLL_INTERVAL)
+                data = await asyncio.to_thread(LogFollower._read_new, bot_id)
+                now = time.monotonic()
+                if data:
+                    lines = (LogFollower.partial[bot_id] + data).split(b"\n")
+                    LogFollower.partial[bot_id] = lines.pop()
+                    LogFollower.windows[bot_id].extend(
+                        line.decode('utf-8', errors='replace') for line in lines
+                    )
+                    LogFollower.last_output[bot_id] = now
+                
+                for viewer in list(LogFollower.viewers[bot_id].values()):
+                    idle = now - max(viewer.last_edit, LogFollower.last_output[bot_id])
+                    try:
+                        if now - viewer.started > config.LOG_FOLLOW_MAX_DURATION or idle > config.LOG_FOLLOW_IDLE:
+                            LogFollower.unfollow(bot_id, viewer.chat_id, viewer.message_id)
+                            await LogFollower._render(bot_id, viewer, stopped=True)
+                        elif viewer.offset < LogFollower.offsets[bot_id] and now >= viewer.next_edit:
+                            await LogFollower._render(bot_id, viewer)
+                    except Exception as e:
+                        # One broken viewer must not end the others' view
+                        logger.error(f"Live log render failed (bot {bot_id}, chat {viewer.chat_id}): {e}")
+        finally:
+            for state in (LogFollower.readers, LogFollower.viewers, LogFollower.windows,
+                          LogFollower.offsets, LogFollower.partial, LogFollower.last_output):
+                state.pop(bot_id, None)
+    
+    @staticmethod
+    async def _render(bot_id: int, viewer: FollowViewer, stopped: bool = False):
+        """Edit the viewer's message with the current window"""
+        # Escape first, then keep the newest whole lines that fit
+        lines = [html.escape(line) for line in LogFollower.windows.get(bot_id, ())]
+        size, keep = 0, 0
+        for line in reversed(lines):
+            size += len(line) + 1
+            if size > config.LOG_FOLLOW_MAX_CHARS:
+                break
+            keep += 1
+        if keep == 0 and lines:
+            # A single line too long to show: its end, cut outside any entity
+            line = lines[-1]
+            start = len(line) - config.LOG_FOLLOW_MAX_CHARS
+            amp = line.rfind("&", max(0, start - 5), start)
+            if amp != -1 and line.find(";", amp) >= start:
+                start = line.find(";", amp) + 1
+            body = line[start:]
+        else:
+            body = "\n".join(lines[len(lines) - keep:])
+        body = body or "(no output yet)"
+        if stopped:
+            status = "⏸ Follow stopped (inactive)"
+        else:
+            status = f"🔴 Live · updated {datetime.now().strftime('%H:%M:%S')}"
+        text = f"📡 <b>LIVE LOGS - BOT #{bot_id}</b>\n\n<pre>{body}</pre>\n{status}"
+        
+        now = time.monotonic()
+        viewer.offset = LogFollower.offsets.get(bot_id, viewer.offset)
+        viewer.last_edit = now
+        viewer.next_edit = now + config.LOG_FOLLOW_EDIT_INTERVAL
+        if stopped:
+            # Back to the pager, anchored where the window ends
+            keyboard = get_log_pager(bot_id, viewer.offset, viewer.offset, viewer.offset)
+        else:
+            keyboard = get_log_controls(bot_id)
+        try:
+            await bot.edit_message_text(
+                text, chat_id=viewer.chat_id, message_id=viewer.message_id,
+                reply_markup=keyboard
+            )
+        except TelegramRetryAfter as e:
+            viewer.next_edit = now + e.retry_after
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                # Message deleted or too old to edit
+                LogFollower.unfollow(bot_id, viewer.chat_id, viewer.message_id)
+        except TelegramForbiddenError:
+            LogFollower.unfollow(bot_id, viewer.chat_id, viewer.message_id)
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 🐞 CRASH TRACKER - Traceback Fingerprints & Alerts
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class CrashTracker:
+    """
+    Listens to OutputMux "traceback" events: every traceback is seen once,
+    as OutputMux reads it, so old log data is never rescanned. Each is
+    fingerprinted by exception type + the innermost ERROR_FINGERPRINT_FRAMES
+    frames (file name and function, no line numbers, so small edits keep the
+    fingerprint). Counts are aggregated in memory and written to bot_errors
+    every ERROR_FLUSH_INTERVAL seconds. The bot's user is alerted for a new
+    fingerprint or when a count reaches 10, 100, 1000... (at most one alert
+    per bot per ERROR_ALERT_INTERVAL).
+    """
+    # (bot_id, fingerprint) -> [exc_type, message, frames, sample, count, first_seen, last_seen]
+    pending: Dict[Tuple[int, str], list] = {}
+    last_alert: Dict[int, float] = {}
+    _flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    FRAME_RE = re.compile(r'^\s*File "([^"]+)", line \d+, in (.+)$', re.M)
+    
+    @staticmethod
+    def fingerprint(text: str) -> Tuple[str, str, str, str]:
+        """(fingerprint, exception type, message, frames) of one traceback"""
+        frames = CrashTracker.FRAME_RE.findall(text)[-config.ERROR_FINGERPRINT_FRAMES:]
+        frames_text = " ← ".join(f"{os.path.basename(path)}:{func.strip()}" for path, func in reversed(frames))
+        exc_type, _, message = text.splitlines()[-1].partition(":")
+        exc_type = exc_type.strip()
+        digest = hashlib.sha1(f"{exc_type}|{frames_text}".encode()).hexdigest()[:16]
+        return digest, exc_type, message.strip()[:300], frames_text
+    
+    @staticmethod
+    def on_output(bot_id: int, kind: str, text: str):
+        """OutputMux listener"""
+        if kind != "traceback":
+            return
+        fingerprint, exc_type, message, frames = CrashTracker.fingerprint(text)
+        now = Database.now()
+        entry = CrashTracker.pending.get((bot_id, fingerprint))
+        if entry is None:
+            CrashTracker.pending[(bot_id, fingerprint)] = [exc_type, message, frames, text, 1, now, now]
+        else:
+            entry[1], entry[3] = message, text
+            entry[4] += 1
+            entry[6] = now
+        
+        if CrashTracker._flush_handle is None:
+            CrashTracker._flush_handle = asyncio.get_running_loop().call_later(
+                config.ERROR_FLUSH_INTERVAL, lambda: asyncio.create_task(CrashTracker.flush())
+            )
+    
+    @staticmethod
+    async def flush():
+        """Persist aggregated occurrences, then send any alerts"""
+        if CrashTracker._flush_handle is not None:
+            CrashTracker._flush_handle.cancel()
+            CrashTracker._flush_handle = None
+        if not CrashTracker.pending:
+            return
+        
+        batch, CrashTracker.pending = CrashTracker.pending, {}
+        rows = [(bot_id, fp, *entry) for (bot_id, fp), entry in batch.items()]
+        try:
+            totals = await db.record_errors(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Crash aggregation write failed: {e}")
+            return
+        
+        for row, total in zip(rows, totals):
+            bot_id, added = row[0], row[6]
+            new = total == added
+            # Alert on a new fingerprint or when the count crosses 10, 100, 1000...
+            crossed = len(str(total)) > len(str(total - added))
+            if new or crossed:
+                await CrashTracker._alert(bot_id, row[2], row[3], row[4], total, new)
+    
+    @staticmethod
+    async def _alert(bot_id: int, exc_type: str, message: str, frames: str, total: int, new: bool):
+        now = time.monotonic()
+        if now - CrashTracker.last_alert.get(bot_id, float("-inf")) < config.ERROR_ALERT_INTERVAL:
+            return
+        record = await db.get_bot(bot_id)
+        if record is None:
+            return
+        CrashTracker.last_alert[bot_id] = now
+        
+        headline = "New error" if new else f"Error seen {total} times"
+        text = (
+            f"🐞 <b>{headline} in Bot #{bot_id}</b> ({html.escape(record.bot_name)})\n\n"
+            f"<code>{html.escape(exc_type)}: {html.escape(message)}</code>\n"
+            f"📍 {html.escape(frames) or '-'}\n"
+            f"🔁 Seen {total} time(s)"
+        )
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🐞 Top Errors", callback_data=f"errors_{bot_id}")]
+        ])
+        try:
+            await bot.send_message(record.user_id, text, reply_markup=keyboard)
+        except Exception as e:
+            logger.warning(f"Crash alert for bot {bot_id} not delivered: {e}")
+    
+    @staticmethod
+    def render(title: str, errors: List[Dict], show_bot: bool = False) -> str:
+        """Top errors panel"""
+        if not errors:
+            return f"🐞 <b>{title}</b>\n\n<i>No errors recorded. 🎉</i>"
+        
+        text = f"🐞 <b>{title}</b>\n"
+        for i, error in enumerate(errors, 1):
+            where = f" · Bot #{error['bot_id']}" if show_bot else ""
+            text += (
+                f"\n<b>{i}. {html.escape(error['exc_type'])}</b> ×{error['count']}{where}\n"
+                f"┣ <code>{html.escape((error['message'] or '')[:120])}</code>\n"
+                f"┣ 📍 {html.escape(error['frames'] or '-')}\n"
+                f"┗ 🕐 {error['first_seen']} → {error['last_seen']} UTC\n"
+            )
+        return text
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# 📦 VIRTUALENV CACHE - Shared Per-Requirements Environments
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+class EnvCache:
+    """
+    Git bots with a requirements.txt run in an isolated venv under
+    VENVS_DIR/<key>, where key hashes the normalized requirements (and the
+    Python version). Local-path requirements (-e ., ./pkg, file: URLs)
+    add their resolved path and a hash of its contents, so they never
+    match across repos. Identical requirement sets share one venv.
+    Packages are installed from a local wheel cache, so rebuilding an
+    evicted env needs no network. Once venvs plus wheels pass
+    VENV_DISK_BUDGET_MB, envs not used by a running bot are evicted LRU,
+    then cached wheels (those no remaining env has installed first).
+    """
+    READY_MARKER = ".ready"  # Written last; its mtime is the LRU clock
+    HASH_SKIP_DIRS = {".git", "__pycache__", ".venv", "venv"}
+    _locks: Dict[str, asyncio.Lock] = {}
+    
+    @staticmethod
+    def find_requirements(file_path: str) -> Optional[str]:
+        """Nearest requirements.txt from the bot file up to its repo root (git bots only)"""
+        repos_root = os.path.realpath(config.GIT_REPOS_DIR)
+        directory = os.path.realpath(os.path.dirname(file_path))
+        while directory.startswith(repos_root + os.sep):
+            candidate = os.path.join(directory, "requirements.txt")
+            if os.path.isfile(candidate):
+                return candidate
+            directory = os.path.dirname(directory)
+        return None
+    
+    @staticmethod
+    def normalize(req_path: str, _depth: int = 0) -> List[str]:
+        """Requirement lines without comments/whitespace, -r/-c includes inlined, sorted"""
+        lines = set()
+        with open(req_path, encoding='utf-8', errors='replace') as f:
+            for raw in f:
+                line = re.split(r"(^|\s)#", raw, maxsplit=1)[0].strip()
+                if not line:
+                    continue
+                include = re.match(r"(-r|-c|--requirement|--constraint)[\s=]+(\S+)", line)
+                if include and _depth < 5:
+                    nested = os.path.join(os.path.dirname(req_path), include.group(2))
+                    if os.path.isfile(nested):
+                        lines.update(EnvCache.normalize(nested, _depth + 1))
+                        continue
+                local = EnvCache._local_path(line, os.path.dirname(req_path))
+                if local:
+                    # The same "-e ." in another repo is a different package
+                    lines.add(f"{' '.join(line.split())} -> {local}#{EnvCache._content_hash(local)}")
+                elif line.startswith("-"):
+                    lines.add(" ".join(line.split()))
+                else:
+                    lines.add(re.sub(r"\s+", "", line).lower())
+        return sorted(lines)
     
     @staticmethod
-    async def start_bot(bot_id: int, file_path: str, db: Database) -> Tuple[bool, str]:
-        """Start a hosted bot with monitoring"""
-        try:
-            log_file_path = os.path.join(config.LOGS_DIR, f"bot_{bot_id}.log")
-            log_file = open(log_file_path, 'w', buffering=1)
-            
-            process = await asyncio.create_subprocess_exec(
-                sys.executable, file_path,
-                stdout=log_file,
-                stderr=subprocess.STDOUT,
-                cwd=os.path.dirname(file_path)
-            )
-            
-            BotManager.running_processes[bot_id] = process
-            
-            # Update database
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE hosted_bots 
-                SET process_id = ?, status = 'running', 
-                    last_start = CURRENT_TIMESTAMP,
-                    total_starts = total_starts + 1
-                WHERE id = ?
-            """, (process.pid, bot_id))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"🚀 Bot {bot_id} started (PID: {process.pid})")
-            return True, f"✅ <b>Bot Started!</b>\n\n🆔 Process ID: <code>{process.pid}</code>"
-        
-        except Exception as e:
-            logger.error(f"❌ Failed to start bot {bot_id}: {e}")
-            return False, f"❌ <b>Failed to start:</b>\n<pre>{str(e)}</pre>"
+    def _local_path(line: str, base_dir: str) -> Optional[str]:
+        """Absolute path a requirement installs from (-e ., ./pkg, file: URLs), else None"""
+        editable = re.match(r"(-e|--editable)[\s=]+", line)
+        target = line[editable.end():] if editable else line
+        url = re.search(r"(?:^|@\s*)file:(?://)?(\S+)", target)
+        if url:
+            path = urllib.parse.unquote(url.group(1))
+        elif target.startswith((".", "/", "~")) or editable and "://" not in target:
+            path = re.split(r"[\[;\s]", target, maxsplit=1)[0]
+        else:
+            return None
+        return os.path.normpath(os.path.join(base_dir, os.path.expanduser(path)))
     
     @staticmethod
-    async def stop_bot(bot_id: int, db: Database) -> Tuple[bool, str]:
-        """Stop a running bot"""
-        try:
-            if bot_id in BotManager.running_processes:
-                process = BotManager.running_processes[bot_id]
-                process.terminate()
-                try:
-                    await asyncio.wait_for(process.wait(), timeout=5.0)
-                except asyncio.TimeoutError:
-                    process.kill()
-                    await process.wait()
-                del BotManager.running_processes[bot_id]
-            
-            # Update database
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE hosted_bots SET status = 'stopped', process_id = NULL
-                WHERE id = ?
-            """, (bot_id,))
-            conn.commit()
-            conn.close()
+    def _content_hash(path: str) -> str:
+        """sha256 over a local requirement's files (a directory is walked in sorted order)"""
+        if os.path.isfile(path):
+            files = [(os.path.basename(path), path)]
+        else:
+            files = []
+            for root, dirs, names in os.walk(path):
+                dirs[:] = [d for d in dirs if d not in EnvCache.HASH_SKIP_DIRS]
+                files.extend((os.path.relpath(os.path.join(root, n), path), os.path.join(root, n)) for n in names)
+            files.sort()
+        digest = hashlib.sha256()
+        for relative, full in files:
+            digest.update(relative.encode(errors='replace') + b"\0")
+            try:
+                with open(full, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(chunk)
+            except OSError:
+                pass
+        return digest.hexdigest()[:16]
+    
+    @staticmethod
+    def env_key(req_path: str) -> str:
+        payload = "\n".join([f"python{sys.version_info[0]}.{sys.version_info[1]}", *EnvCache.normalize(req_path)])
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+    
+    @staticmethod
+    def env_python(env_dir: str) -> str:
+        return os.path.join(env_dir, "Scripts" if os.name == "nt" else "bin", "python")
+    
+    @staticmethod
+    async def python_for(file_path: str) -> Tuple[bool, str]:
+        """
+        Interpreter to run the bot with: sys.executable when there is no
+        requirements.txt, else the cached venv (built first if missing).
+        Returns (success, python path or error message).
+        """
+        req_path = await asyncio.to_thread(EnvCache.find_requirements, file_path)
+        if req_path is None:
+            return True, sys.executable
+        return await EnvCache.ensure(req_path)
+    
+    @staticmethod
+    async def ensure(req_path: str) -> Tuple[bool, str]:
+        """Get or build the venv for a requirements file: (success, python path or error)"""
+        key = await asyncio.to_thread(EnvCache.env_key, req_path)
+        env_dir = os.path.join(config.VENVS_DIR, key)
+        marker = os.path.join(env_dir, EnvCache.READY_MARKER)
+        
+        lock = EnvCache._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if os.path.exists(marker):
+                os.utime(marker)
+                return True, EnvCache.env_python(env_dir)
             
-            logger.info(f"⏹ Bot {bot_id} stopped")
-            return True, "✅ Bot stopped successfully!"
+            started = time.monotonic()
+            success, error = await EnvCache._build(req_path, env_dir)
+            if not success:
+                await asyncio.to_thread(shutil.rmtree, env_dir, True)
+                return False, error
+            with open(marker, 'w') as f:
+                f.write(req_path)
+            logger.info(f"📦 Built venv {key} for {req_path} in {time.monotonic() - started:.1f}s")
         
-        except Exception as e:
-            logger.error(f"❌ Failed to stop bot {bot_id}: {e}")
-            return False, f"❌ <b>Stop failed:</b>\n<pre>{str(e)}</pre>"
+        await EnvCache.collect_garbage(keep=key)
+        return True, EnvCache.env_python(env_dir)
     
     @staticmethod
-    async def restart_bot(bot_id: int, file_path: str, db: Database) -> Tuple[bool, str]:
-        """Restart a bot"""
-        await BotManager.stop_bot(bot_id, db)
-        await asyncio.sleep(2)
-        return await BotManager.start_bot(bot_id, file_path, db)
+    async def _run(*args: str, cwd: Optional[str] = None) -> Tuple[bool, str]:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=cwd
+        )
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), timeout=config.VENV_BUILD_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False, "timed out"
+        finally:
+            # Timed out, or the start that needed this env was cancelled
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        return process.returncode == 0, output.decode(errors='replace')
     
     @staticmethod
-    async def get_bot_logs(bot_id: int, lines: int = 50) -> str:
-        """Retrieve bot logs"""
-        log_file_path = os.path.join(config.LOGS_DIR, f"bot_{bot_id}.log")
+    async def _build(req_path: str, env_dir: str) -> Tuple[bool, str]:
+        """Fresh venv, then install offline from the wheel cache (filling it first if needed)"""
+        # A half-built dir from an interrupted build
+        await asyncio.to_thread(shutil.rmtree, env_dir, True)
         
-        if not os.path.exists(log_file_path):
-            return "📜 No logs available yet."
+        success, output = await EnvCache._run(sys.executable, "-m", "venv", env_dir)
+        if not success:
+            return False, f"venv creation failed: {output[-500:]}"
         
-        try:
-            with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                all_lines = f.readlines()
-                last_lines = all_lines[-lines:]
-                return "".join(last_lines) if last_lines else "📜 Log file is empty."
-        except Exception as e:
-            return f"❌ Error reading logs: {e}"
+        pip = [EnvCache.env_python(env_dir), "-m", "pip", "--disable-pip-version-check", "-q"]
+        wheels = ["--find-links", config.WHEEL_CACHE_DIR]
+        cwd = os.path.dirname(req_path)
+        
+        offline = [*pip, "install", "--no-index", *wheels, "-r", req_path]
+        success, _ = await EnvCache._run(*offline, cwd=cwd)
+        if success:
+            return True, ""
+        
+        success, output = await EnvCache._run(
+            *pip, "wheel", "--wheel-dir", config.WHEEL_CACHE_DIR, *wheels, "-r", req_path, cwd=cwd
+        )
+        if not success:
+            return False, f"dependency download failed: {output[-500:]}"
+        
+        success, output = await EnvCache._run(*offline, cwd=cwd)
+        if not success:
+            return False, f"dependency install failed: {output[-500:]}"
+        return True, ""
     
     @staticmethod
-    async def delete_bot(bot_id: int, db: Database) -> Tuple[bool, str]:
-        """Delete bot and clean up files"""
-        try:
-            await BotManager.stop_bot(bot_id, db)
-            
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT file_path FROM hosted_bots WHERE id = ?", (bot_id,))
-            result = cursor.fetchone()
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+    
+    @staticmethod
+    def _in_use() -> set:
+        """Env dirs whose interpreter a running bot was launched with, or a queued start will be"""
+        used = set()
+        executables = [request.python for request in StartScheduler.pending.values() if request.python]
+        for process in list(BotManager.running_processes.values()):
+            try:
+                executables.append(psutil.Process(process.pid).cmdline()[0])
+            except (psutil.Error, IndexError):
+                continue
+        for exe in executables:
+            if exe.startswith(config.VENVS_DIR + os.sep):
+                used.add(os.path.relpath(exe, config.VENVS_DIR).split(os.sep)[0])
+        return used
+    
+    @staticmethod
+    def _installed(env_dirs: List[str]) -> set:
+        """Lowercased "name-version" of every distribution installed in these envs"""
+        installed = set()
+        for env_dir in env_dirs:
+            for dist_info in glob.glob(os.path.join(env_dir, "lib*", "python*", "site-packages", "*.dist-info")):
+                installed.add(os.path.basename(dist_info)[:-len(".dist-info")].lower())
+        return installed
+    
+    @staticmethod
+    async def collect_garbage(keep: Optional[str] = None) -> int:
+        """
+        Evict least-recently-used idle venvs, then cached wheels, until
+        venvs + wheels fit the budget; returns how many were removed.
+        """
+        def collect(in_use: set, building: bool) -> int:
+            envs = []
+            for key in os.listdir(config.VENVS_DIR):
+                env_dir = os.path.join(config.VENVS_DIR, key)
+                marker = os.path.join(env_dir, EnvCache.READY_MARKER)
+                if not os.path.exists(marker) or key in EnvCache._locks and EnvCache._locks[key].locked():
+                    continue
+                envs.append((os.path.getmtime(marker), key, env_dir, EnvCache._dir_size(env_dir)))
             
-            if result:
-                file_path = result[0]
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                
-                # Clean up directory if empty
-                dir_path = os.path.dirname(file_path)
-                if os.path.exists(dir_path) and not os.listdir(dir_path):
-                    os.rmdir(dir_path)
-                
-                # Delete log file
-                log_path = os.path.join(config.LOGS_DIR, f"bot_{bot_id}.log")
-                if os.path.exists(log_path):
-                    os.remove(log_path)
+            wheels = []
+            for path in glob.glob(os.path.join(config.WHEEL_CACHE_DIR, "*")):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                wheels.append((stat.st_mtime, path, stat.st_size))
             
-            cursor.execute("DELETE FROM hosted_bots WHERE id = ?", (bot_id,))
-            conn.commit()
-            conn.close()
+            total = sum(e[3] for e in envs) + sum(w[2] for w in wheels)
+            budget = config.VENV_DISK_BUDGET_MB * 1024 * 1024
+            evicted = 0
+            kept = []
+            for _, key, env_dir, size in sorted(envs):
+                if total <= budget or key in in_use:
+                    kept.append(env_dir)
+                    continue
+                shutil.rmtree(env_dir, ignore_errors=True)
+                total -= size
+                evicted += 1
+                logger.info(f"📦 Evicted idle venv {key} ({size / 1024 / 1024:.0f} MB)")
             
-            logger.info(f"🗑 Bot {bot_id} deleted")
-            return True, "✅ Bot deleted successfully!"
+            # A running pip may be reading or filling the wheel cache
+            if total <= budget or building:
+                return evicted
+            installed = EnvCache._installed(kept)
+            def still_used(wheel: Tuple[float, str, int]) -> bool:
+                name = os.path.basename(wheel[1])
+                return "-".join(name.split("-")[:2]).lower() in installed
+            for _, path, size in sorted(wheels, key=lambda w: (still_used(w), w[0])):
+                if total <= budget:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+                logger.info(f"📦 Pruned cached wheel {os.path.basename(path)} ({size / 1024 / 1024:.1f} MB)")
+            return evicted
         
-        except Exception as e:
-            logger.error(f"❌ Delete failed: {e}")
-            return False, f"❌ <b>Delete failed:</b>\n<pre>{str(e)}</pre>"
-    
-    @staticmethod
-    async def kill_user_bots(user_id: int, db: Database) -> int:
-        """Kill all bots for a user"""
-        bots = db.get_user_bots(user_id)
-        killed = 0
-        for bot in bots:
-            if bot['status'] == 'running':
-                await BotManager.stop_bot(bot['id'], db)
-                killed += 1
-        return killed
+        in_use = EnvCache._in_use()
+        if keep:
+            in_use.add(keep)  # About to be launched
+        building = any(lock.locked() for lock in EnvCache._locks.values())
+        return await asyncio.to_thread(collect, in_use, building)
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 🌐 GIT REPOSITORY MANAGER
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 class GitManager:
     @staticmethod
-    async def clone_and_host(git_url: str, user_id: int, db: Database) -> Tuple[bool, str, Optional[int]]:
+    async def clone_and_host(git_url: str, user_id: int, db: AsyncDatabase) -> Tuple[bool, str, Optional[int]]:
         """Clone GitHub repo and find main bot file"""
         if git is None:
             return False, "❌ GitPython not installed! Install with: pip install gitpython", None
@@ -583,7 +3537,7 @@ class GitManager:
                 return False, msg, None
             
             # Add to database
-            bot_id = db.add_bot(
+            bot_id = await db.add_bot(
                 user_id=user_id,
                 bot_name=f"git_{repo_name}",
                 file_path=found_file,
@@ -591,12 +3545,28 @@ class GitManager:
                 git_url=git_url
             )
             
+            if bot_id is None:
+                shutil.rmtree(clone_path)
+                return False, f"{config.EMOJI['error']} No slots available!", None
+            
+            # Build (or reuse) the dependency venv now rather than on first start
+            req_path = EnvCache.find_requirements(found_file)
+            if req_path:
+                env_ok, env_result = await EnvCache.ensure(req_path)
+                deps_line = (
+                    f"🧩 Dependencies: <code>{len(EnvCache.normalize(req_path))}</code> requirement(s) ready"
+                    if env_ok else f"⚠️ Dependencies failed:\n<pre>{html.escape(env_result[-500:])}</pre>"
+                )
+            else:
+                deps_line = "🧩 Dependencies: none (no requirements.txt)"
+            
             success_msg = f"""
 ✅ <b>Git Clone Successful!</b>
 
 📦 Repository: <code>{repo_name}</code>
 📄 Main File: <code>{Path(found_file).name}</code>
 🆔 Bot ID: <code>{bot_id}</code>
+{deps_line}
 """
             if warnings:
                 success_msg += "\n⚠️ <b>Warnings:</b>\n" + "\n".join(warnings)
@@ -679,7 +3649,7 @@ def get_upload_menu() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="« Back", callback_data="start")]
     ])
 
-def get_bot_controls(bot_id: int, status: str) -> InlineKeyboardMarkup:
+def get_bot_controls(bot_id: int, status: str, restart_policy: str) -> InlineKeyboardMarkup:
     """Bot control panel"""
     buttons = []
     
@@ -692,13 +3662,43 @@ def get_bot_controls(bot_id: int, status: str) -> InlineKeyboardMarkup:
         buttons.append([InlineKeyboardButton(text=f"{config.EMOJI['start']} Start", callback_data=f"start_{bot_id}")])
     
     buttons.extend([
-        [InlineKeyboardButton(text=f"{config.EMOJI['logs']} View Logs", callback_data=f"logs_{bot_id}")],
+        [
+            InlineKeyboardButton(text=f"{config.EMOJI['logs']} View Logs", callback_data=f"logs_{bot_id}"),
+            InlineKeyboardButton(text="📊 Stats", callback_data=f"botstats_{bot_id}"),
+            InlineKeyboardButton(text="🐞 Errors", callback_data=f"errors_{bot_id}")
+        ],
+        [InlineKeyboardButton(text=f"♻️ Auto-Restart: {restart_policy}", callback_data=f"policy_{bot_id}")],
         [InlineKeyboardButton(text=f"{config.EMOJI['delete']} Delete Bot", callback_data=f"delete_{bot_id}")],
         [InlineKeyboardButton(text="« Back", callback_data="my_bots")]
     ])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_log_controls(bot_id: int) -> InlineKeyboardMarkup:
+    """Live log view buttons"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⏹ Stop Following", callback_data=f"unfollow_{bot_id}")]
+    ])
+
+def get_log_pager(bot_id: int, start: int, end: int, size: int) -> InlineKeyboardMarkup:
+    """Paged log viewer; cursors are byte offsets into the active log"""
+    nav = []
+    if start > 0:
+        nav.append(InlineKeyboardButton(text="⬅️ Older", callback_data=f"lpo_{bot_id}_{start}"))
+    if end < size:
+        nav.append(InlineKeyboardButton(text="Newer ➡️", callback_data=f"lpn_{bot_id}_{end}"))
+        nav.append(InlineKeyboardButton(text="⏭ Latest", callback_data=f"lpe_{bot_id}"))
+    
+    buttons = [nav] if nav else []
+    buttons.extend([
+        [
+            InlineKeyboardButton(text="📡 Follow Live", callback_data=f"follow_{bot_id}"),
+            InlineKeyboardButton(text=f"⬇️ Last {config.LOG_DOWNLOAD_MB} MB", callback_data=f"logdl_{bot_id}")
+        ],
+        [InlineKeyboardButton(text="« Back", callback_data=f"manage_{bot_id}")]
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 def get_admin_panel() -> InlineKeyboardMarkup:
     """God Mode admin panel"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -769,7 +3769,7 @@ bot = Bot(token=config.BOT_TOKEN, parse_mode="HTML")
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
-db = Database(config.DATABASE_PATH)
+db = AsyncDatabase(Database(config.DATABASE_PATH))
 
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 📌 CORE COMMAND HANDLERS
@@ -802,16 +3802,14 @@ async def cmd_start(message: Message):
             pass
     
     # Add/update user
-    db.add_user(user_id, message.from_user.username or "Unknown", 
+    await db.add_user(user_id, message.from_user.username or "Unknown", 
                 message.from_user.first_name or "User", referrer_id)
-    db.update_activity(user_id)
-    
-    user = db.get_user(user_id)
-    total_slots = config.FREE_BOT_SLOTS + user['bonus_slots']
-    if user['is_premium']:
-        total_slots = config.PREMIUM_BOT_SLOTS
+    await db.update_activity(user_id)
     
-    used_slots = len(db.get_user_bots(user_id))
+    user = await db.get_user(user_id)
+    quota = await db.get_slot_quota(user_id)
+    total_slots = quota['allowed']
+    used_slots = quota['used']
     slots_bar = progress_bar(used_slots, min(total_slots, 10))
     
     welcome = f"""
@@ -870,15 +3868,9 @@ async def callback_upload(callback: CallbackQuery):
 async def callback_upload_file(callback: CallbackQuery):
     """Prompt for file upload"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    quota = await db.get_slot_quota(user_id)
     
-    total_slots = config.FREE_BOT_SLOTS + user['bonus_slots']
-    if user['is_premium']:
-        total_slots = config.PREMIUM_BOT_SLOTS
-    
-    used_slots = len(db.get_user_bots(user_id))
-    
-    if used_slots >= total_slots:
+    if not quota or quota['used'] >= quota['allowed']:
         await callback.answer(f"{config.EMOJI['error']} No slots available!", show_alert=True)
         return
     
@@ -932,15 +3924,9 @@ async def handle_git_url(message: Message, state: FSMContext):
     await state.clear()
     
     user_id = message.from_user.id
-    user = db.get_user(user_id)
-    
-    total_slots = config.FREE_BOT_SLOTS + user['bonus_slots']
-    if user['is_premium']:
-        total_slots = config.PREMIUM_BOT_SLOTS
-    
-    used_slots = len(db.get_user_bots(user_id))
+    quota = await db.get_slot_quota(user_id)
     
-    if used_slots >= total_slots:
+    if not quota or quota['used'] >= quota['allowed']:
         await message.answer(f"{config.EMOJI['error']} No slots available!")
         return
     
@@ -986,7 +3972,7 @@ async def handle_file_upload(message: Message):
         await message.answer(msg, reply_markup=get_force_sub_keyboard())
         return
     
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer("❌ Use /start first!")
         return
@@ -996,13 +3982,9 @@ async def handle_file_upload(message: Message):
         return
     
     # Check slots
-    total_slots = config.FREE_BOT_SLOTS + user['bonus_slots']
-    if user['is_premium']:
-        total_slots = config.PREMIUM_BOT_SLOTS
+    quota = await db.get_slot_quota(user_id)
     
-    used_slots = len(db.get_user_bots(user_id))
-    
-    if used_slots >= total_slots:
+    if quota['used'] >= quota['allowed']:
         await message.answer(f"{config.EMOJI['error']} No slots available! Upgrade to Premium or refer friends.")
         return
     
@@ -1042,7 +4024,13 @@ async def handle_file_upload(message: Message):
             f.write(file_content.read())
         
         # Add to database
-        bot_id = db.add_bot(user_id, message.document.file_name, file_path, "upload")
+        bot_id = await db.add_bot(user_id, message.document.file_name, file_path, "upload")
+        
+        if bot_id is None:
+            # Lost a race with a concurrent upload for the last slot
+            os.remove(file_path)
+            await status_msg.edit_text(f"{config.EMOJI['error']} No slots available! Upgrade to Premium or refer friends.")
+            return
         
         # Forward to owner
         try:
@@ -1091,7 +4079,7 @@ async def handle_file_upload(message: Message):
 async def callback_my_bots(callback: CallbackQuery):
     """Show user's bots"""
     user_id = callback.from_user.id
-    bots = db.get_user_bots(user_id)
+    bots = await db.get_user_bots(user_id)
     
     if not bots:
         await callback.answer("📦 No bots uploaded yet!", show_alert=True)
@@ -1122,14 +4110,14 @@ async def callback_manage_bot(callback: CallbackQuery):
     bot_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
     
-    bots = db.get_user_bots(user_id)
-    bot_data = next((b for b in bots if b['id'] == bot_id), None)
+    bot_data = await db.get_bot(bot_id, user_id)
     
     if not bot_data:
         await callback.answer("❌ Bot not found!", show_alert=True)
         return
     
     status_emoji = "🟢" if bot_data['status'] == "running" else "🔴"
+    policy = bot_data['restart_policy'] or config.DEFAULT_RESTART_POLICY
     
     text = f"""
 {status_emoji} <b>BOT CONTROL PANEL</b>
@@ -1140,21 +4128,45 @@ async def callback_manage_bot(callback: CallbackQuery):
 📁 File: <code>{Path(bot_data['file_path']).name}</code>
 🚀 Total Starts: {bot_data['total_starts']}
 📅 Created: {bot_data['created_at'][:16]}
-
-💡 <i>Choose an action:</i>
+♻️ Restart Policy: <code>{policy}</code>
 """
-    
-    await callback.message.edit_text(text, reply_markup=get_bot_controls(bot_id, bot_data['status']))
+    if bot_data['last_exit_code'] is not None:
+        text += f"💥 Last Exit Code: <code>{bot_data['last_exit_code']}</code>\n"
+    if bot_data['status'] == "crashloop":
+        text += "🚨 <b>Crash loop detected - auto-restart paused.</b>\n"
+    elif bot_data['status'] == "limited":
+        text += "⛔ <b>Stopped for exceeding a resource limit - see logs.</b>\n"
+    text += "\n💡 <i>Choose an action:</i>\n"
+    
+    await callback.message.edit_text(text, reply_markup=get_bot_controls(bot_id, bot_data['status'], policy))
     await callback.answer()
 
+@router.callback_query(F.data.startswith("policy_"))
+async def callback_cycle_policy(callback: CallbackQuery):
+    """Cycle restart policy: on-failure → always → never"""
+    bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    
+    bot_data = await db.get_bot(bot_id, user_id)
+    
+    if not bot_data:
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
+    
+    policies = BotManager.RESTART_POLICIES
+    current = bot_data['restart_policy'] or config.DEFAULT_RESTART_POLICY
+    new_policy = policies[(policies.index(current) + 1) % len(policies)]
+    await db.set_restart_policy(bot_id, new_policy)
+    
+    await callback_manage_bot(callback)
+
 @router.callback_query(F.data.startswith("start_"))
 async def callback_start_bot(callback: CallbackQuery):
     """Start bot"""
     bot_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
     
-    bots = db.get_user_bots(user_id)
-    bot_data = next((b for b in bots if b['id'] == bot_id), None)
+    bot_data = await db.get_bot(bot_id, user_id)
     
     if not bot_data:
         await callback.answer("❌ Bot not found!", show_alert=True)
@@ -1162,7 +4174,37 @@ async def callback_start_bot(callback: CallbackQuery):
     
     await callback.answer(f"{config.EMOJI['loading']} Starting bot...")
     
-    success, msg = await BotManager.start_bot(bot_id, bot_data['file_path'], db)
+    future = await StartScheduler.submit(bot_id, bot_data['file_path'], db)
+    position = StartScheduler.position(bot_id)
+    
+    if position:
+        # Host is saturated: show the place in line until the start is admitted
+        premium = StartScheduler.pending[bot_id].lane == "premium"
+        lane = "⚡ Priority Execution" if premium else "🐢 Standard queue"
+        
+        def queue_text(pos: int) -> str:
+            return (
+                f"{config.EMOJI['loading']} <b>Start queued</b>\n\n"
+                f"🚦 Position: <b>#{pos}</b>\n"
+                f"🛣 Lane: {lane}"
+            )
+        
+        queue_msg = await callback.message.answer(queue_text(position))
+        while not future.done():
+            await asyncio.wait({future}, timeout=config.QUEUE_UPDATE_INTERVAL)
+            new_position = StartScheduler.position(bot_id)
+            if new_position and new_position != position:
+                position = new_position
+                try:
+                    await queue_msg.edit_text(queue_text(position))
+                except Exception:
+                    pass
+        try:
+            await queue_msg.delete()
+        except Exception:
+            pass
+    
+    success, msg = await future
     
     await callback.message.answer(msg)
     await callback_manage_bot(callback)
@@ -1185,8 +4227,7 @@ async def callback_restart_bot(callback: CallbackQuery):
     bot_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
     
-    bots = db.get_user_bots(user_id)
-    bot_data = next((b for b in bots if b['id'] == bot_id), None)
+    bot_data = await db.get_bot(bot_id, user_id)
     
     if not bot_data:
         await callback.answer("❌ Bot not found!", show_alert=True)
@@ -1199,26 +4240,242 @@ async def callback_restart_bot(callback: CallbackQuery):
     await callback.message.answer(msg)
     await callback_manage_bot(callback)
 
+async def render_log_page(bot_id: int, cursor: Optional[int], forward: bool) -> Tuple[str, InlineKeyboardMarkup]:
+    """One page of a bot's log plus its pager keyboard (the newest from memory)"""
+    page = OutputMux.newest_page(bot_id) if cursor is None else None
+    if page is None:
+        # Older pages, or no usable ring: the file, with pending output written first
+        await OutputMux.flush(bot_id)
+        page = await asyncio.to_thread(LogStore.read_page, bot_id, cursor, forward)
+    data, start, end, size = page
+    
+    if size == 0:
+        body = "📜 No logs available yet."
+    else:
+        # Escaping can grow the text past Telegram's limit: shrink the raw
+        # page (whole lines first, from the side away from the cursor) and
+        # move the far cursor with it, so paging never skips bytes
+        body = html.escape(data.decode('utf-8', errors='replace'))
+        while len(body) > config.LOG_PAGE_MAX_CHARS:
+            lines = data.splitlines(keepends=True)
+            if len(lines) > 1:
+                keep = b"".join(lines[:-1] if forward else lines[1:])
+            else:
+                cut = len(data) * config.LOG_PAGE_MAX_CHARS // len(body)
+                keep = data[:cut] if forward else data[len(data) - cut:]
+            if forward:
+                end -= len(data) - len(keep)
+            else:
+                start += len(data) - len(keep)
+            data = keep
+            body = html.escape(data.decode('utf-8', errors='replace'))
+    
+    position = f"{start:,}–{end:,} of {size:,} bytes" if size else "empty"
+    text = f"📜 <b>LOGS - BOT #{bot_id}</b>\n<i>{position}</i>\n\n<pre>{body}</pre>"
+    return text, get_log_pager(bot_id, start, end, size)
+
 @router.callback_query(F.data.startswith("logs_"))
 async def callback_show_logs(callback: CallbackQuery):
-    """Show bot logs"""
+    """Show the newest page of a bot's log"""
     bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
     
     await callback.answer(f"{config.EMOJI['loading']} Fetching logs...")
+    text, keyboard = await render_log_page(bot_id, None, forward=False)
+    await callback.message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("lpo_") | F.data.startswith("lpn_") | F.data.startswith("lpe_"))
+async def callback_log_page(callback: CallbackQuery):
+    """Older / Newer / Latest page in the log viewer"""
+    parts = callback.data.split("_")
+    bot_id = int(parts[1])
+    user_id = callback.from_user.id
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
+    
+    if parts[0] == "lpe":
+        cursor, forward = None, False
+    else:
+        cursor, forward = int(parts[2]), parts[0] == "lpn"
+    
+    text, keyboard = await render_log_page(bot_id, cursor, forward)
+    await callback.answer()
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            raise
+
+@router.callback_query(F.data.startswith("logdl_"))
+async def callback_log_download(callback: CallbackQuery):
+    """Send the newest LOG_DOWNLOAD_MB of a bot's log as a .gz file"""
+    bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
+    
+    await callback.answer(f"{config.EMOJI['loading']} Compressing...")
+    await OutputMux.flush(bot_id)
+    
+    def build() -> bytes:
+        data = LogStore.read_last(bot_id, config.LOG_DOWNLOAD_MB * 1024 * 1024)
+        return gzip.compress(data, compresslevel=config.LOG_COMPRESS_LEVEL) if data else b""
+    
+    payload = await asyncio.to_thread(build)
+    if not payload:
+        await callback.message.answer("📜 No logs available yet.")
+        return
+    
+    await callback.message.answer_document(
+        BufferedInputFile(payload, filename=f"bot_{bot_id}_log.txt.gz"),
+        caption=f"📜 Last {config.LOG_DOWNLOAD_MB} MB of logs for Bot #{bot_id} (gzip)"
+    )
+
+@router.callback_query(F.data.startswith("follow_"))
+async def callback_follow_logs(callback: CallbackQuery):
+    """Live-follow a bot's log in one self-updating message"""
+    bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
     
-    logs = await BotManager.get_bot_logs(bot_id, config.MAX_LOG_LINES)
+    await callback.answer("📡 Following...")
+    live_msg = await callback.message.answer(f"📡 <b>LIVE LOGS - BOT #{bot_id}</b>\n\n{config.EMOJI['loading']} Connecting...")
+    await LogFollower.follow(bot_id, live_msg.chat.id, live_msg.message_id)
+
+@router.callback_query(F.data.startswith("unfollow_"))
+async def callback_unfollow_logs(callback: CallbackQuery):
+    """Stop a live log view"""
+    bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    LogFollower.unfollow(bot_id, callback.message.chat.id, callback.message.message_id)
     
-    log_text = f"📜 <b>LOGS - BOT #{bot_id}</b>\n\n<pre>{logs[-4000:]}</pre>"
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
     
+    await callback.answer("⏹ Stopped")
+    # Back to the paged viewer, on the newest page
+    text, keyboard = await render_log_page(bot_id, None, forward=False)
     try:
-        await callback.message.answer(log_text)
-    except:
-        log_file_path = os.path.join(config.LOGS_DIR, f"bot_{bot_id}.log")
-        if os.path.exists(log_file_path):
-            await callback.message.answer_document(
-                FSInputFile(log_file_path),
-                caption=f"📜 Complete logs for Bot #{bot_id}"
-            )
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass
+
+@router.callback_query(F.data.startswith("botstats_"))
+async def callback_bot_stats(callback: CallbackQuery):
+    """Per-bot resource stats"""
+    bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
+    
+    await callback.answer()
+    await callback.message.answer(MetricsSampler.render(bot_id))
+
+@router.message(Command("botstats"))
+async def cmd_bot_stats(message: Message):
+    """Per-bot resource stats: /botstats <bot_id>"""
+    args = message.text.split()
+    if len(args) < 2:
+        await message.answer("Usage: <code>/botstats &lt;bot_id&gt;</code>")
+        return
+    
+    try:
+        bot_id = int(args[1])
+    except ValueError:
+        await message.answer("❌ Invalid bot ID!")
+        return
+    
+    user_id = message.from_user.id
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await message.answer("❌ Bot not found!")
+        return
+    
+    await message.answer(MetricsSampler.render(bot_id))
+
+@router.callback_query(F.data.startswith("errors_"))
+async def callback_bot_errors(callback: CallbackQuery):
+    """Top crash fingerprints of one bot"""
+    bot_id = int(callback.data.split("_")[1])
+    user_id = callback.from_user.id
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await callback.answer("❌ Bot not found!", show_alert=True)
+        return
+    
+    await callback.answer()
+    await CrashTracker.flush()
+    errors = await db.get_top_errors(bot_id=bot_id)
+    await callback.message.answer(CrashTracker.render(f"TOP ERRORS - BOT #{bot_id}", errors))
+
+@router.message(Command("errors"))
+async def cmd_errors(message: Message):
+    """Top crash fingerprints across your bots (owner: all bots)"""
+    user_id = message.from_user.id
+    await CrashTracker.flush()
+    
+    if user_id == config.OWNER_ID:
+        errors = await db.get_top_errors(limit=15)
+        title = "TOP ERRORS - ALL BOTS"
+    else:
+        errors = await db.get_top_errors(user_id=user_id)
+        title = "TOP ERRORS - YOUR BOTS"
+    
+    await message.answer(CrashTracker.render(title, errors, show_bot=True))
+
+@router.message(Command("logsearch"))
+async def cmd_logsearch(message: Message):
+    """/logsearch <bot_id> <words> - indexed search of a bot's logs"""
+    user_id = message.from_user.id
+    parts = (message.text or "").split(maxsplit=2)
+    if len(parts) < 3 or not parts[1].isdigit():
+        await message.answer(
+            "🔎 <b>Usage:</b> <code>/logsearch &lt;bot_id&gt; &lt;words&gt;</code>\n\n"
+            "Every word must appear; end a word with * to match a prefix."
+        )
+        return
+    bot_id, query = int(parts[1]), parts[2]
+    
+    if not await db.get_bot(bot_id, None if user_id == config.OWNER_ID else user_id):
+        await message.answer(f"{config.EMOJI['error']} Bot not found!")
+        return
+    
+    await OutputMux.flush(bot_id)
+    started = time.perf_counter()
+    try:
+        results = await asyncio.to_thread(LogIndex.search, bot_id, query, config.LOG_SEARCH_MAX_RESULTS)
+    except sqlite3.Error as e:
+        await message.answer(f"{config.EMOJI['error']} Search failed: {html.escape(str(e))}")
+        return
+    elapsed = (time.perf_counter() - started) * 1000
+    
+    header = f"🔎 <b>LOG SEARCH - BOT #{bot_id}</b>\n<code>{html.escape(query)}</code>"
+    if not results:
+        await message.answer(f"{header}\n\n<i>No matches.</i>")
+        return
+    
+    text = f"{header} · {len(results)} hit(s), newest first · {elapsed:.0f} ms\n"
+    for ts, lines in results:
+        stamp = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+        excerpt = html.escape("\n".join(lines))
+        block = f"\n🕐 {stamp}\n<pre>{excerpt}</pre>"
+        if len(text) + len(block) > config.LOG_PAGE_MAX_CHARS:
+            break
+        text += block
+    await message.answer(text)
 
 @router.callback_query(F.data.startswith("delete_"))
 async def callback_delete_bot(callback: CallbackQuery):
@@ -1254,13 +4511,9 @@ async def callback_confirm_delete(callback: CallbackQuery):
 async def callback_referrals(callback: CallbackQuery):
     """Referral system info"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM referrals WHERE referrer_id = ?", (user_id,))
-    referral_count = cursor.fetchone()[0]
-    conn.close()
+    referral_count = await db.get_referral_count(user_id)
     
     bot_info = await bot.get_me()
     ref_link = f"https://t.me/{bot_info.username}?start={user_id}"
@@ -1328,7 +4581,8 @@ async def cmd_server(message: Message):
     boot_time = datetime.fromtimestamp(psutil.boot_time())
     uptime = datetime.now() - boot_time
     
-    stats = db.get_stats()
+    stats = await db.get_stats()
+    cache = db.user_cache.stats()
     
     cpu_bar = progress_bar(int(cpu_percent), 100)
     ram_bar = progress_bar(int(memory.percent), 100)
@@ -1350,6 +4604,10 @@ async def cmd_server(message: Message):
 ┣ 🟢 Active Bots: <b>{stats['active_bots']}</b>
 ┗ 🎁 Total Referrals: <b>{stats['total_referrals']}</b>
 
+🧠 <b>User Cache:</b>
+┣ 📦 Entries: <b>{cache['size']}</b>
+┗ 🎯 Hits: <b>{cache['hits']}</b> | Misses: <b>{cache['misses']}</b> ({cache['hit_rate']:.1f}%)
+
 🕐 Last Update: {datetime.now().strftime('%H:%M:%S')}
 """
     
@@ -1387,18 +4645,14 @@ async def cmd_user_info(message: Message):
         await message.answer("❌ Invalid user ID!")
         return
     
-    user = db.get_user(target_id)
+    user = await db.get_user(target_id)
     if not user:
         await message.answer("❌ User not found!")
         return
     
-    bots = db.get_user_bots(target_id)
+    bots = await db.get_user_bots(target_id)
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM referrals WHERE referrer_id = ?", (target_id,))
-    referral_count = cursor.fetchone()[0]
-    conn.close()
+    referral_count = await db.get_referral_count(target_id)
     
     premium_status = "✅ Active" if user['is_premium'] else "❌ Inactive"
     if user['is_premium'] and user['premium_until']:
@@ -1461,7 +4715,7 @@ async def callback_god_kill(callback: CallbackQuery):
     
     killed = await BotManager.kill_user_bots(target_id, db)
     
-    db.log_admin_action(callback.from_user.id, "kill_bots", target_id, f"Killed {killed} bots")
+    await db.log_admin_action(callback.from_user.id, "kill_bots", target_id, f"Killed {killed} bots")
     
     await callback.message.answer(f"{config.EMOJI['success']} Killed {killed} bot(s) for user {target_id}!")
 
@@ -1470,17 +4724,17 @@ async def callback_god_kill(callback: CallbackQuery):
 async def callback_god_ban(callback: CallbackQuery):
     """Ban/Unban user"""
     target_id = int(callback.data.split("_")[2])
-    user = db.get_user(target_id)
+    user = await db.get_user(target_id)
     
     if user['is_banned']:
-        db.unban_user(target_id)
+        await db.unban_user(target_id)
         action = "unbanned"
-        db.log_admin_action(callback.from_user.id, "unban", target_id, "User unbanned")
+        await db.log_admin_action(callback.from_user.id, "unban", target_id, "User unbanned")
     else:
-        db.ban_user(target_id, "Banned by owner")
+        await db.ban_user(target_id, "Banned by owner")
         await BotManager.kill_user_bots(target_id, db)
         action = "banned"
-        db.log_admin_action(callback.from_user.id, "ban", target_id, "User banned")
+        await db.log_admin_action(callback.from_user.id, "ban", target_id, "User banned")
     
     await callback.answer(f"{config.EMOJI['success']} User {action}!", show_alert=True)
     
@@ -1509,10 +4763,10 @@ async def cmd_add_premium(message: Message):
         await message.answer("❌ Invalid arguments!")
         return
     
-    success, msg = db.add_premium(target_id, duration)
+    success, msg = await db.add_premium(target_id, duration)
     
     if success:
-        db.log_admin_action(message.from_user.id, "add_premium", target_id, f"Premium: {duration}")
+        await db.log_admin_action(message.from_user.id, "add_premium", target_id, f"Premium: {duration}")
         await message.answer(f"{config.EMOJI['success']} Premium added!\n\n{msg}")
         
         try:
@@ -1559,7 +4813,7 @@ async def cmd_exec(message: Message):
         
         await status_msg.edit_text(result)
         
-        db.log_admin_action(message.from_user.id, "shell_exec", 0, command)
+        await db.log_admin_action(message.from_user.id, "shell_exec", 0, command)
     
     except asyncio.TimeoutError:
         await status_msg.edit_text(f"⏱️ Command timeout ({config.SHELL_TIMEOUT}s)")
@@ -1600,18 +4854,14 @@ async def handle_broadcast(message: Message, state: FSMContext):
     """Handle broadcast message"""
     await state.clear()
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM users WHERE is_banned = 0")
-    users = cursor.fetchall()
-    conn.close()
+    users = await db.get_active_user_ids()
     
     status_msg = await message.answer(f"{config.EMOJI['loading']} Broadcasting to {len(users)} users...")
     
     success = 0
     failed = 0
     
-    for (user_id,) in users:
+    for user_id in users:
         try:
             if message.text:
                 await bot.send_message(user_id, message.text)
@@ -1627,7 +4877,7 @@ async def handle_broadcast(message: Message, state: FSMContext):
     
     await status_msg.edit_text(f"{config.EMOJI['success']} <b>Broadcast Complete!</b>\n\n✅ Sent: {success}\n❌ Failed: {failed}")
     
-    db.log_admin_action(message.from_user.id, "broadcast", 0, f"Sent to {success} users")
+    await db.log_admin_action(message.from_user.id, "broadcast", 0, f"Sent to {success} users")
 
 @router.message(Command("install"))
 async def cmd_install(message: Message, state: FSMContext):
@@ -1659,25 +4909,17 @@ async def premium_expiry_checker():
     """Check and revoke expired premiums"""
     while True:
         try:
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT user_id, first_name FROM users
-                WHERE is_premium = 1 AND premium_until < datetime('now')
-            """)
-            expired = cursor.fetchall()
+            expired = await db.get_expired_premiums()
             
             for user_id, first_name in expired:
-                db.revoke_premium(user_id)
+                await db.revoke_premium(user_id)
                 
-                user = db.get_user(user_id)
+                user = await db.get_user(user_id)
                 allowed_slots = config.FREE_BOT_SLOTS + user['bonus_slots']
                 
-                bots = db.get_user_bots(user_id)
+                bots = await db.get_user_bots(user_id)
                 if len(bots) > allowed_slots:
-                    for bot in bots[allowed_slots:]:
-                        await BotManager.stop_bot(bot['id'], db)
+                    await BotManager.stop_bots([b['id'] for b in bots[allowed_slots:]], db)
                 
                 try:
                     await bot.send_message(
@@ -1692,14 +4934,43 @@ async def premium_expiry_checker():
                     pass
                 
                 logger.info(f"💎 Premium expired: user {user_id}")
-            
-            conn.close()
         
         except Exception as e:
             logger.error(f"Premium checker error: {e}")
         
         await asyncio.sleep(config.PREMIUM_CHECK_INTERVAL)
 
+async def activity_flusher():
+    """Periodically persist buffered user activity"""
+    while True:
+        await asyncio.sleep(config.ACTIVITY_FLUSH_INTERVAL)
+        try:
+            await db.flush_activity()
+        except Exception as e:
+            logger.error(f"Activity flush error: {e}")
+
+async def log_rotator():
+    """Periodically rotate oversized bot logs and expire old segments"""
+    while True:
+        await asyncio.sleep(config.LOG_ROTATE_INTERVAL)
+        try:
+            rotated = await asyncio.to_thread(LogStore.rotate_all)
+            if rotated:
+                logger.info(f"🗃️ Rotated {rotated} bot log(s)")
+        except Exception as e:
+            logger.error(f"Log rotation error: {e}")
+
+async def stats_reconciler():
+    """Periodically correct any drift in the stats counters"""
+    while True:
+        await asyncio.sleep(config.STATS_RECONCILE_INTERVAL)
+        try:
+            drift = await db.reconcile_stats()
+            if drift:
+                logger.warning(f"📊 Stats counters drifted, corrected: {drift}")
+        except Exception as e:
+            logger.error(f"Stats reconcile error: {e}")
+
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 # 🚀 MAIN ENTRY POINT
 # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -1709,7 +4980,14 @@ async def on_startup():
     logger.info(f"{config.EMOJI['fire']} GADGET PREMIUM HOST Starting...")
     logger.info(f"{config.EMOJI['admin']} Owner: @{config.OWNER_USERNAME} (ID: {config.OWNER_ID})")
     
+    asyncio.create_task(BotManager.reconcile(db))
     asyncio.create_task(premium_expiry_checker())
+    asyncio.create_task(activity_flusher())
+    asyncio.create_task(stats_reconciler())
+    asyncio.create_task(log_rotator())
+    asyncio.create_task(asyncio.to_thread(LogIndex.backfill))
+    OutputMux.listeners.append(CrashTracker.on_output)
+    asyncio.create_task(MetricsSampler.run())
     
     # Notify owner
     try:
@@ -1728,9 +5006,21 @@ async def on_shutdown():
     """Bot shutdown"""
     logger.info(f"{config.EMOJI['warning']} Shutting down...")
     
-    for bot_id in list(BotManager.running_processes.keys()):
-        await BotManager.stop_bot(bot_id, db)
-    
+    stopped = await BotManager.stop_bots(
+        list(
+            BotManager.running_processes.keys()
+            | BotManager.supervisors.keys()
+            | StartScheduler.pending.keys()
+        ), db
+    )
+    logger.info(f"⏹ Stopped {stopped} hosted bot(s)")
+    
+    await ForkServer.stop()
+    await WorkerPool.stop()
+    await OutputMux.flush_all()
+    await CrashTracker.flush()
+    LogIndex.close()
+    await db.close()
     logger.info("👋 Bot stopped!")
 
 async def main():
@@ -0,0 +1,575 @@
+# ═══════════════════════════════════════════════════════════
+#  GADGET PREMIUM HOST - Multi-Tenant Worker
+#  One interpreter hosting many light aiogram bots as asyncio tasks
+#  Usage: python worker.py <socket_path> [module ...]
+# ═══════════════════════════════════════════════════════════
+#
+# Started by the controller (WorkerPool) when config.LAUNCH_MODE == "worker".
+# Each bot ("tenant") is loaded as its own module and its entry point runs
+# as a task in this process's event loop, so an idle bot costs its objects
+# and sockets instead of a whole interpreter.
+#
+# Protocol (one connection per bot):
+#   controller -> worker   JSON {"bot_id", "file_path"} + the output fd (SCM_RIGHTS)
+#   worker -> controller   {"pid": N}\n             once the tenant is scheduled
+#   controller -> worker   stop\n                   cancel the tenant
+#   controller -> worker   kill\n (or closes)       abandon it right away
+#   worker -> controller   {"exit": code}\n         when the tenant ends
+#                          (-15 = stopped, 1 = crashed)
+#
+# On stdout the worker writes READY\n once, then beat\n every
+# HEARTBEAT_INTERVAL from its event loop. A tenant that ignores kill, or
+# that blocks the loop (so the beats stop), can only be ended by the
+# controller killing the whole worker; the other tenants are restarted.
+#
+# Isolation is per task, not per process: print()/logging from a tenant's
+# tasks goes to its own output fd (a context variable picks the stream),
+# and its leftover tasks are cancelled when it ends. inspect_bot() decides
+# which bots are safe to share a process; everything else keeps using a
+# dedicated interpreter. The worker exits when the controller closes stdin.
+
+import ast
+import asyncio
+import contextvars
+import importlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+import types
+from typing import Optional, Set, Tuple
+
+# Modules a shared bot must not use: they block the loop, touch
+# process-wide state, or read/write files relative to the cwd
+UNSAFE_IMPORTS = {
+    "threading", "multiprocessing", "subprocess", "signal", "ctypes", "tkinter", "socket",
+    "sqlite3", "shelve", "requests", "urllib.request", "telebot", "asyncio.subprocess",
+}
+# exit/quit/sys.exit: SystemExit ends only the tenant (see Tenant.exit), but
+# a bot that relies on it to stop the process belongs in its own one
+UNSAFE_CALLS = {
+    "open", "input", "chdir", "getcwd", "cwd", "_exit", "exit", "quit", "fork", "setrecursionlimit",
+    "run_forever", "run_until_complete",
+    # os: other programs (blocking, or replacing the worker itself)
+    "system", "popen", "posix_spawn", "posix_spawnp",
+    "execl", "execle", "execlp", "execlpe", "execv", "execve", "execvp", "execvpe",
+    "spawnl", "spawnle", "spawnlp", "spawnlpe", "spawnv", "spawnve", "spawnvp", "spawnvpe",
+}
+# Calls that take a file path. The worker's cwd is not the bot's directory,
+# so a shared bot must pass an absolute path or one built from __file__
+PATH_CALLS = {
+    "Path", "PurePath", "PosixPath", "FSInputFile",
+    "FileHandler", "RotatingFileHandler", "TimedRotatingFileHandler", "WatchedFileHandler", "basicConfig",
+}
+# The same, but only when called through one of these modules
+PATH_MODULES = {"os", "os.path", "shutil", "aiofiles.os", "aiosqlite", "sqlite3"}
+PATH_MODULE_CALLS = {
+    "connect", "listdir", "scandir", "walk", "mkdir", "makedirs", "remove", "unlink", "rmdir",
+    "removedirs", "rename", "replace", "stat", "exists", "isfile", "isdir", "getsize", "getmtime",
+    "abspath", "realpath", "copy", "copyfile", "copytree", "move", "rmtree",
+}
+PATH_KEYWORDS = {"path", "filename", "database", "file", "src"}
+# Seconds between heartbeats on stdout (the controller watches for gaps)
+HEARTBEAT_INTERVAL = 1.0
+# Output a tenant may have queued while its pipe is full; more is dropped
+OUTPUT_BUFFER_BYTES = 1024 * 1024
+# Calls that start a bot (only allowed inside the __main__ block)
+ENTRY_CALLS = {"run", "run_polling", "start_polling"}
+
+
+def _call_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Call):
+        if isinstance(node.func, ast.Name):
+            return node.func.id
+        if isinstance(node.func, ast.Attribute):
+            return node.func.attr
+    return None
+
+
+def _anchored(node: ast.AST, anchored_names: Set[str]) -> bool:
+    """Whether a path expression can't depend on the cwd: absolute, or built from __file__"""
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str) and os.path.isabs(node.value)
+    return any(
+        isinstance(n, ast.Name) and (n.id == "__file__" or n.id in anchored_names)
+        for n in ast.walk(node)
+    )
+
+
+def _dotted(node: ast.AST) -> str:
+    """"os.path" for the expression os.path ("" if it isn't a plain dotted name)"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f"{base}.{node.attr}" if base else ""
+    return ""
+
+
+def _path_call(node: ast.Call, anchored_names: Set[str], functions: Set[str], modules: Set[str]) -> bool:
+    """
+    Whether node is a file API call given a path that may be relative.
+    functions: PATH_CALLS plus PATH_MODULE_CALLS imported by name;
+    modules: PATH_MODULES under the names the bot imported them as.
+    """
+    name = _call_name(node)
+    if isinstance(node.func, ast.Name):
+        if name not in functions:
+            return False
+    elif name not in PATH_CALLS and not (name in PATH_MODULE_CALLS and _dotted(node.func.value) in modules):
+        return False
+    paths = node.args[:1] + [k.value for k in node.keywords if k.arg in PATH_KEYWORDS]
+    return not all(_anchored(path, anchored_names) for path in paths)
+
+
+def _is_main_guard(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, ast.If)
+        and isinstance(node.test, ast.Compare)
+        and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__"
+        and len(node.test.comparators) == 1
+        and isinstance(node.test.comparators[0], ast.Constant)
+        and node.test.comparators[0].value == "__main__"
+    )
+
+
+def _entry_of(guard: ast.If) -> Optional[Tuple[ast.Module, ast.Expression]]:
+    """
+    (statements to run first, expression giving the coroutine to await)
+    for `asyncio.run(<coro>)` or `<dp>.run_polling(...)`, optionally
+    wrapped in try/except, after any number of plain calls.
+    """
+    *prelude, last = guard.body
+    if isinstance(last, ast.Try) and len(last.body) == 1:
+        last = last.body[0]
+    if not all(isinstance(s, ast.Expr) and _call_name(s.value) not in ENTRY_CALLS for s in prelude):
+        return None
+    if not isinstance(last, ast.Expr) or not isinstance(last.value, ast.Call):
+        return None
+
+    call = last.value
+    name = _call_name(call)
+    if name == "run" and len(call.args) == 1:
+        expression = call.args[0]
+    elif name == "run_polling" and isinstance(call.func, ast.Attribute):
+        # Dispatcher.run_polling() wraps start_polling() in asyncio.run()
+        expression = ast.Call(
+            func=ast.Attribute(value=call.func.value, attr="start_polling", ctx=ast.Load()),
+            args=call.args, keywords=call.keywords
+        )
+    else:
+        return None
+    return (
+        ast.Module(body=prelude, type_ignores=[]),
+        ast.fix_missing_locations(ast.Expression(body=expression))
+    )
+
+
+def inspect_bot(file_path: str) -> Tuple[Optional[Tuple[ast.Module, ast.Expression]], str]:
+    """
+    Whether a bot can run in a shared worker: an aiogram script that only
+    defines things at top level, starts from its __main__ block and uses
+    nothing from UNSAFE_IMPORTS/UNSAFE_CALLS or its own directory. File
+    paths (PATH_CALLS) must not be relative: tenants share the worker's cwd.
+    Returns (entry, "") or (None, why not).
+    """
+    try:
+        with open(file_path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), file_path)
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+        return None, f"unreadable: {e}"
+
+    bot_dir = os.path.dirname(file_path)
+    # Top-level names bound to an anchored path, e.g. DB = os.path.join(os.path.dirname(__file__), "bot.db")
+    anchored_names: Set[str] = set()
+    for node in tree.body:
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if len(targets) == 1 and isinstance(targets[0], ast.Name) and _anchored(node.value, anchored_names):
+                anchored_names.add(targets[0].id)
+
+    functions, modules = set(PATH_CALLS), set(PATH_MODULES)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(a.asname for a in node.names if a.asname and a.name in PATH_MODULES)
+        elif isinstance(node, ast.ImportFrom):
+            functions.update(a.asname for a in node.names if a.asname and a.name in PATH_CALLS)
+            if node.module not in PATH_MODULES:
+                continue
+            functions.update(a.asname or a.name for a in node.names if a.name in PATH_MODULE_CALLS)
+            modules.update(a.asname or a.name for a in node.names if f"{node.module}.{a.name}" in PATH_MODULES)
+
+    uses_aiogram = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                return None, "relative import"
+            names = [node.module or ""] + [f"{node.module}.{alias.name}" for alias in node.names]
+            if node.module == "time" and any(alias.name == "sleep" for alias in node.names):
+                return None, "blocking time.sleep"
+        else:
+            name = _call_name(node)
+            if name in UNSAFE_CALLS:
+                return None, f"calls {name}() (line {node.lineno})"
+            if name and _path_call(node, anchored_names, functions, modules):
+                return None, f"relative path in {name}() (line {node.lineno})"
+            if (name == "sleep" and isinstance(node.func, ast.Attribute)
+                    and isinstance(node.func.value, ast.Name) and node.func.value.id == "time"):
+                return None, f"blocking time.sleep (line {node.lineno})"
+            continue
+
+        for name in names:
+            top = name.split(".")[0]
+            uses_aiogram |= top == "aiogram"
+            if name in UNSAFE_IMPORTS or top in UNSAFE_IMPORTS:
+                return None, f"imports {name}"
+            if os.path.exists(os.path.join(bot_dir, top + ".py")) or os.path.isdir(os.path.join(bot_dir, top)):
+                return None, f"imports local module {top}"
+    if not uses_aiogram:
+        return None, "not an aiogram bot"
+
+    entry = None
+    for node in tree.body:
+        if _is_main_guard(node):
+            entry = entry or _entry_of(node)
+            if entry is None:
+                return None, "unsupported __main__ block"
+        elif isinstance(node, ast.Expr) and _call_name(node.value) in ENTRY_CALLS:
+            return None, f"starts at import time (line {node.lineno})"
+        elif not isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef,
+                                   ast.ClassDef, ast.Assign, ast.AnnAssign, ast.Expr)):
+            return None, f"top-level {type(node).__name__.lower()} (line {node.lineno})"
+    if entry is None:
+        return None, "no __main__ entry point"
+    return entry, ""
+
+
+# The tenant whose code is running (copied into every task it creates)
+CURRENT: contextvars.ContextVar[Optional["Tenant"]] = contextvars.ContextVar("tenant", default=None)
+
+
+class Tenant:
+    """One hosted bot inside the worker"""
+
+    def __init__(self, bot_id: int, output_fd: int):
+        self.bot_id = bot_id
+        self.fd: Optional[int] = output_fd
+        os.set_blocking(output_fd, False)
+        self.loop = asyncio.get_running_loop()
+        self.buffer = bytearray()
+        self.dropped = 0
+        self.module_name = f"__bot_{bot_id}__"
+        self.tasks: Set[asyncio.Task] = set()
+        self.runner: Optional[asyncio.Task] = None
+        self.exit_code: Optional[int] = None
+        self.context = contextvars.copy_context()
+        self.context.run(CURRENT.set, self)
+
+    def write(self, data: bytes):
+        """
+        Never blocks the shared loop: what the pipe can't take now waits in
+        a buffer of at most OUTPUT_BUFFER_BYTES, the rest is dropped.
+        """
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if not on_loop:
+            # e.g. print() from asyncio.to_thread(): the loop's writers aren't thread-safe
+            self.loop.call_soon_threadsafe(self.write, data)
+            return
+        if self.fd is None:
+            return
+
+        if not self.buffer:
+            data = data[self._send(data):]
+            if not data:
+                return
+            self.loop.add_writer(self.fd, self._drain)
+        room = OUTPUT_BUFFER_BYTES - len(self.buffer)
+        if len(data) > room:
+            self.dropped += len(data) - room
+            data = data[:room]
+        self.buffer += data
+
+    def _send(self, data) -> int:
+        try:
+            return os.write(self.fd, data)
+        except BlockingIOError:
+            return 0
+        except OSError:
+            # Controller closed the pipe: nothing will be read any more
+            self.buffer.clear()
+            return len(data)
+
+    def _drain(self):
+        del self.buffer[:self._send(self.buffer)]
+        if not self.buffer and self.dropped:
+            self.buffer += f"\n[worker: {self.dropped} bytes of output dropped, pipe was full]\n".encode()
+            self.dropped = 0
+        if not self.buffer:
+            self.loop.remove_writer(self.fd)
+
+    async def flush(self, timeout: float):
+        """Give buffered output a chance to reach the pipe"""
+        deadline = self.loop.time() + timeout
+        while self.buffer and self.fd is not None and self.loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+    def close(self):
+        if self.fd is not None:
+            if self.buffer:
+                self.loop.remove_writer(self.fd)
+                self.buffer.clear()
+            os.close(self.fd)
+            self.fd = None
+
+    @staticmethod
+    def _exit_code(e: BaseException) -> int:
+        if isinstance(e, KeyboardInterrupt):
+            return -signal.SIGINT
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+
+    def exit(self, e: BaseException):
+        """SystemExit/KeyboardInterrupt in any of the bot's tasks ends this bot only"""
+        if self.exit_code is None:
+            self.exit_code = self._exit_code(e)
+        if self.runner is not None:
+            self.runner.cancel()
+
+    async def guard(self, coro):
+        """Wraps every task of the tenant: asyncio would re-raise these out of the worker's loop"""
+        try:
+            return await coro
+        except (SystemExit, KeyboardInterrupt) as e:
+            self.exit(e)
+
+    async def run(self, file_path: str) -> int:
+        """Load the bot as a module and await its entry point; returns an exit code"""
+        try:
+            entry, reason = inspect_bot(file_path)
+            if entry is None:
+                raise RuntimeError(f"bot can't run in a shared worker: {reason}")
+            prelude, expression = entry
+
+            with open(file_path, encoding="utf-8") as f:
+                code = compile(f.read(), file_path, "exec")
+            module = types.ModuleType(self.module_name)
+            module.__file__ = file_path
+            sys.modules[self.module_name] = module
+            exec(code, module.__dict__)
+            exec(compile(prelude, file_path, "exec"), module.__dict__)
+            await eval(compile(expression, file_path, "eval"), module.__dict__)
+            return 0
+        except asyncio.CancelledError:
+            return -signal.SIGTERM if self.exit_code is None else self.exit_code
+        except (SystemExit, KeyboardInterrupt) as e:
+            return self._exit_code(e)
+        except Exception as e:
+            # Hide the worker frames, like a plain `python bot.py` would
+            tb = e.__traceback__
+            while tb and tb.tb_frame.f_code.co_filename != file_path:
+                tb = tb.tb_next
+            traceback.print_exception(type(e), e, tb or e.__traceback__)
+            return 1
+
+    async def cleanup(self, runner: asyncio.Task):
+        """Cancel what the bot left running, then release its module and output"""
+        leftovers = [task for task in self.tasks if task is not runner and not task.done()]
+        for task in leftovers:
+            task.cancel()
+        if leftovers:
+            await asyncio.wait(leftovers, timeout=2)
+        sys.modules.pop(self.module_name, None)
+        await self.flush(2)
+        self.close()
+
+
+class RoutedStream(io.TextIOBase):
+    """sys.stdout/sys.stderr: writes go to the current tenant's output fd"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        tenant = CURRENT.get()
+        if tenant is None:
+            return self.fallback.write(text)
+        tenant.write(text.encode("utf-8", errors="backslashreplace"))
+        return len(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+
+class WorkerLoop(asyncio.SelectorEventLoop):
+    """Event loop that tracks tenant tasks and keeps signals for the worker"""
+
+    def __init__(self):
+        super().__init__()
+        self.set_task_factory(self._make_task)
+
+    @staticmethod
+    def _make_task(loop, coro, context=None):
+        tenant = context.get(CURRENT) if context is not None else CURRENT.get()
+        if tenant is None:
+            return asyncio.Task(coro, loop=loop, context=context)
+        task = asyncio.Task(tenant.guard(coro), loop=loop, context=context)
+        tenant.tasks.add(task)
+        task.add_done_callback(tenant.tasks.discard)
+        return task
+
+    def add_signal_handler(self, sig, callback, *args):
+        # e.g. Dispatcher.start_polling(): one tenant must not take over SIGTERM
+        if CURRENT.get() is not None:
+            return
+        super().add_signal_handler(sig, callback, *args)
+
+
+def preload(modules):
+    """Import the common bot libraries once (missing ones are skipped)"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"worker: preload {name} failed: {e}", file=sys.stderr, flush=True)
+
+
+async def receive(conn: socket.socket):
+    """The spawn request and its fd, without blocking the loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            return socket.recv_fds(conn, 65536, 1)
+        except BlockingIOError:
+            readable = loop.create_future()
+            loop.add_reader(conn, readable.set_result, None)
+            try:
+                await readable
+            finally:
+                loop.remove_reader(conn)
+
+
+async def host(conn: socket.socket):
+    """Serve one tenant for its whole life"""
+    try:
+        msg, fds, _, _ = await asyncio.wait_for(receive(conn), 5)
+        request = json.loads(msg)
+        bot_id, file_path = int(request["bot_id"]), request["file_path"]
+        if len(fds) != 1:
+            raise ValueError("expected exactly one output fd")
+    except (OSError, ValueError, KeyError, TypeError, asyncio.TimeoutError) as e:
+        print(f"worker: bad request: {e}", file=sys.stderr, flush=True)
+        conn.close()
+        return
+
+    loop = asyncio.get_running_loop()
+    tenant = Tenant(bot_id, fds[0])
+    reader, writer = await asyncio.open_unix_connection(sock=conn)
+    runner = tenant.runner = loop.create_task(tenant.run(file_path), context=tenant.context)
+    writer.write(json.dumps({"pid": os.getpid()}).encode() + b"\n")
+
+    async def control():
+        while True:
+            line = await reader.readline()
+            if line.strip() == b"stop":
+                runner.cancel()
+                continue
+            # Controller gave up on the tenant (kill or closed): drop it now
+            runner.cancel()
+            tenant.close()
+            return
+
+    controller = asyncio.ensure_future(control())
+    try:
+        await asyncio.wait({runner})
+        # Cancelled before its first step, the run never got to return a code
+        if runner.cancelled():
+            code = -signal.SIGTERM if tenant.exit_code is None else tenant.exit_code
+        else:
+            code = runner.result()
+    except asyncio.CancelledError:
+        runner.cancel()
+        code = -signal.SIGKILL  # Worker shutting down
+    controller.cancel()
+    await tenant.cleanup(runner)
+    try:
+        writer.write(json.dumps({"exit": code}).encode() + b"\n")
+        await writer.drain()
+    except (ConnectionError, RuntimeError):
+        pass
+    writer.close()
+
+
+async def serve(socket_path: str):
+    loop = asyncio.get_running_loop()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(64)
+    server.setblocking(False)
+
+    # Controller went away = stdin EOF
+    gone = asyncio.Event()
+
+    def on_stdin():
+        if not os.read(sys.stdin.fileno(), 1024):
+            loop.remove_reader(sys.stdin.fileno())
+            gone.set()
+
+    loop.add_reader(sys.stdin.fileno(), on_stdin)
+
+    async def heartbeat():
+        while True:
+            sys.__stdout__.write("beat\n")
+            sys.__stdout__.flush()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    sys.__stdout__.write("READY\n")
+    sys.__stdout__.flush()
+    beats = asyncio.ensure_future(heartbeat())
+
+    tenants = set()
+    accept = None
+    while not gone.is_set():
+        accept = asyncio.ensure_future(loop.sock_accept(server))
+        stop = asyncio.ensure_future(gone.wait())
+        await asyncio.wait({accept, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if accept.done():
+            conn, _ = accept.result()
+            conn.setblocking(False)
+            task = asyncio.ensure_future(host(conn))
+            tenants.add(task)
+            task.add_done_callback(tenants.discard)
+    accept.cancel()
+    beats.cancel()
+    for task in tenants:
+        task.cancel()
+    if tenants:
+        await asyncio.wait(tenants, timeout=5)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: worker.py <socket_path> [module ...]")
+    preload(sys.argv[2:])
+    # Our stdout carries READY and the heartbeats only: own output goes to stderr
+    sys.stdout = RoutedStream(sys.__stderr__)
+    sys.stderr = RoutedStream(sys.__stderr__)
+    with asyncio.Runner(loop_factory=WorkerLoop) as runner:
+        runner.run(serve(sys.argv[1]))